@@ -1,18 +1,24 @@
 import wx
 import asyncio
+import aiohttp
 import multiprocessing
 import argparse
+import sqlite3
+import time
+from typing import Dict, List
 
 from wxasync import WxAsyncApp
 
 from ui.main_frame import MainFrame
 from ui.dialogs.auth import AuthDialog
 import ui.dialogs.user
+import ui.dialogs.compare_backups
 
 import globals.config
 import globals.token
 import spotify.constants
 import spotify.net
+import spotify.cache
 import spotify.debug
 from spotify.validators.playlists import Playlists
 from spotify.validators.playlist import Playlist
@@ -27,23 +33,46 @@ from spotify.listener import (
 import playlist_manager
 
 import globals.logger
+import globals.watchdog
 from globals.state import (
     SpotifyState,
     UI,
     UserState
 )
 
+# seconds a prefetch waits before sending its request
+PREFETCH_DELAY = 0.25
+# seconds before the access token expires that it gets refreshed
+TOKEN_REFRESH_MARGIN = 300
+# the most backups offered when choosing two to compare
+MAX_BACKUPS_LISTED = 100
+# seconds to wait for the user to stop typing before searching
+SEARCH_DELAY = 0.15
+
 
 class SPBackupApp(WxAsyncApp):
 
     def __init__(self, warn_on_cancel_callback=False, **kwargs):
         super().__init__(warn_on_cancel_callback, **kwargs)
         self.playlist_manager = playlist_manager.PlaylistManager()
+        # background requests for the next and previous track pages keyed by url
+        self.prefetch_tasks: Dict[str, asyncio.Task] = {}
+        # streaming a backup comparison into the TracksCtrl
+        self.backup_diff_task: asyncio.Task = None
+        self.search_task: asyncio.Task = None
+        # refreshes the access token before it expires
+        self.token_refresh_task: asyncio.Task = None
+        # only one refresh request at a time
+        self.token_lock = asyncio.Lock()
+        # requests returning a 401 ask for a new token and are sent again
+        spotify.net.set_token_refresher(self.refresh_token)
 
     def reset(self):
         """cleans up the UI and resets the global state for the Playlists
         """
         # Set the Playlists and PlayList state to None
+        self.cancel_prefetch()
+        SpotifyState.clear_page_cache()
         SpotifyState.set_playlist(None)
         SpotifyState.set_playlists(None)
         # Disable the Buttons on the Toolbar
@@ -59,7 +88,10 @@ class SPBackupApp(WxAsyncApp):
         """
         self.reset()
         # remove the token
+        self.cancel_token_refresh()
         globals.token.remove()
+        # the next login may be a different account
+        spotify.cache.get_cache().set_account(None)
         # rerun the process of authentication
         self.run_background_auth_check()
 
@@ -68,8 +100,10 @@ class SPBackupApp(WxAsyncApp):
         else will try and load users playlists and store the global token. 
         """
         # load the token from our .token.json file
-        token: str = globals.token.load()["token"]
-        UserState.set_token(token)
+        token_info: dict = globals.token.load()
+        token: str = token_info["token"]
+        UserState.set_token_info(
+            token, token_info["refresh_token"], token_info["expires_at"])
         if not token:
             globals.logger.console(
                 "No Token found. Requesting Authorization...", "info")
@@ -77,9 +111,71 @@ class SPBackupApp(WxAsyncApp):
         else:
             globals.logger.console(
                 "Token found. Retrieving Playlists from User...", "info")
+            self.schedule_token_refresh()
             loop = asyncio.get_event_loop()
             loop.create_task(self.retrieve_user_and_playlists(token))
 
+    def store_token(self, token_info: dict):
+        """saves the token info to file and sets the UserState
+
+        Args:
+            token_info (dict): check spotify.net.create_token_info
+        """
+        globals.token.save(
+            token_info["access_token"], token_info["refresh_token"], token_info["expires_at"])
+        UserState.set_token_info(
+            token_info["access_token"], token_info["refresh_token"], token_info["expires_at"])
+
+    async def refresh_token(self, expired_token: str = None) -> str:
+        """gets a new access token with the stored refresh token. Concurrent requests
+        that got a 401 with the same expired token only cause one refresh
+
+        Args:
+            expired_token (str, optional): the token that was rejected. Defaults to None.
+
+        Returns:
+            str: the new access token. None if the token couldnt be refreshed
+        """
+        async with self.token_lock:
+            token = UserState.get_token()
+            if expired_token is not None and token and token != expired_token:
+                # another request has already refreshed it
+                return token
+            refresh_token = UserState.get_refresh_token()
+            if not refresh_token:
+                return None
+            try:
+                token_info = await spotify.net.refresh_access_token(
+                    globals.config.CLIENT_ID, globals.config.CLIENT_SECRET, refresh_token)
+            except (spotify.net.SpotifyError, aiohttp.ClientError, asyncio.TimeoutError) as err:
+                globals.logger.console(f"Could not refresh the access token. {err}", "error")
+                return None
+            self.store_token(token_info)
+            globals.logger.console("Access token has been refreshed", "info")
+            return token_info["access_token"]
+
+    def schedule_token_refresh(self):
+        """starts the background task that refreshes the access token before it expires.
+        Does nothing if there is no refresh token
+        """
+        self.cancel_token_refresh()
+        if UserState.get_refresh_token():
+            self.token_refresh_task = asyncio.get_event_loop().create_task(
+                self.token_refresh_loop())
+
+    def cancel_token_refresh(self):
+        if self.token_refresh_task is not None:
+            self.token_refresh_task.cancel()
+            self.token_refresh_task = None
+
+    async def token_refresh_loop(self):
+        while True:
+            expires_at = UserState.get_expires_at() or time.time()
+            await asyncio.sleep(max(expires_at - TOKEN_REFRESH_MARGIN - time.time(), 0))
+            if await self.refresh_token() is None:
+                # the 401 handling will ask the user to authorize again
+                return
+
     async def retrieve_user_and_playlists(self, token: str):
         """gets the user information from the loaded token and also retrieved playlists
 
@@ -87,11 +183,15 @@ class SPBackupApp(WxAsyncApp):
             token (str): User token
         """
         try:
-            await self.retrieve_playlists(token)
             user = await spotify.net.get_user_info(token)
+            # the cached responses of this account can be used from now on
+            spotify.cache.get_cache().set_account(user.id)
+            await self.retrieve_playlists(token)
             await self.playlist_manager.create_backup_directory(user)
         except spotify.net.SpotifyError as err:
             self.handle_spotify_error(err)
+        except sqlite3.Error as err:
+            UI.statusbar.SetStatusText(f"Could not open the backup database. {err}")
         finally:
             return
 
@@ -120,6 +220,108 @@ class SPBackupApp(WxAsyncApp):
         except spotify.net.SpotifyError as err:
             self.handle_spotify_error(error=err)
 
+    async def retrieve_backups_to_compare(self):
+        """loads the stored backups and asks which two to compare
+        """
+        if self.playlist_manager.storage is None:
+            # not authorized yet so there is no backup database
+            return
+        try:
+            backups = await self.playlist_manager.list_backups(limit=MAX_BACKUPS_LISTED)
+        except sqlite3.Error as err:
+            UI.statusbar.SetStatusText(f"Could not load the backups. {err}")
+            return
+        if len(backups) < 2:
+            UI.statusbar.SetStatusText("At least two backups are needed to compare")
+            return
+        wx.CallAfter(self.open_compare_backups_dialog, backups)
+
+    async def retrieve_backups_to_restore(self, playlist_ids: List[str] = None):
+        """loads the stored backups and asks which one to restore
+
+        Args:
+            playlist_ids (List[str], optional): only restore these Spotify playlist IDs. Defaults to None.
+        """
+        if self.playlist_manager.storage is None:
+            return
+        try:
+            backups = await self.playlist_manager.list_backups(limit=MAX_BACKUPS_LISTED)
+        except sqlite3.Error as err:
+            UI.statusbar.SetStatusText(f"Could not load the backups. {err}")
+            return
+        if not backups:
+            UI.statusbar.SetStatusText("There are no backups to restore")
+            return
+        wx.CallAfter(self.open_restore_dialog, backups, playlist_ids)
+
+    def open_restore_dialog(self, backups: List[playlist_manager.StoredBackup], playlist_ids: List[str]):
+        dlg = wx.SingleChoiceDialog(
+            UI.main_frame, "Restore the playlists from", "Restore Backup",
+            [f"{backup.name} ({backup.date_added})" for backup in backups])
+        with dlg:
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            backup = backups[dlg.GetSelection()]
+        task: asyncio.Task = self.playlist_manager.running_task
+        if task and not task.done():
+            UI.statusbar.SetStatusText("Wait for the running backup or restore to finish")
+            return
+        self.playlist_manager.running_task = asyncio.get_event_loop().create_task(
+            self.playlist_manager.restore_backup(
+                self.playlists_restore_handler, UserState.get_token(), backup.id, playlist_ids))
+
+    def open_compare_backups_dialog(self, backups: List[playlist_manager.StoredBackup]):
+        selection = ui.dialogs.compare_backups.create_dialog(UI.main_frame, backups)
+        if selection is not None:
+            if self.backup_diff_task is not None:
+                self.backup_diff_task.cancel()
+            self.backup_diff_task = asyncio.get_event_loop().create_task(
+                self.show_backup_diff(*selection))
+
+    async def show_backup_diff(self, old_backup_id: int, new_backup_id: int):
+        """streams the differences between two backups into the TracksCtrl
+
+        Args:
+            old_backup_id (int): the Backups primary key to compare from
+            new_backup_id (int): the Backups primary key to compare to
+        """
+        UI.tracksctrl.clear_items()
+        changed = 0
+        try:
+            async for diff in self.playlist_manager.iter_backup_diff(old_backup_id, new_backup_id):
+                UI.tracksctrl.add_backup_diff(diff)
+                changed += 1
+        except sqlite3.Error as err:
+            UI.statusbar.SetStatusText(f"Could not compare the backups. {err}")
+            return
+        UI.statusbar.SetStatusText(f"{changed} playlists changed between the backups")
+
+    def search_backups(self, text: str):
+        """searches every backup for the text once the user stops typing.
+        A new search cancels the one still waiting or running
+
+        Args:
+            text (str): the search box text
+        """
+        if self.search_task is not None:
+            self.search_task.cancel()
+        self.search_task = asyncio.get_event_loop().create_task(self.retrieve_search_results(text))
+
+    async def retrieve_search_results(self, text: str):
+        if not text.strip():
+            UI.tracksctrl.clear_items()
+            return
+        await asyncio.sleep(SEARCH_DELAY)
+        if self.playlist_manager.storage is None:
+            return
+        try:
+            results = await self.playlist_manager.search_tracks(text)
+        except sqlite3.Error as err:
+            UI.statusbar.SetStatusText(f"Could not search the backups. {err}")
+            return
+        UI.tracksctrl.populate_search(results)
+        UI.statusbar.SetStatusText(f"{len(results)} tracks found")
+
     async def retrieve_playlist(self, playlist_id: int):
         """sends a playlist request by ID. will set the global playlist if successful.
         Raises a SpotifyError if unsuccessful
@@ -127,11 +329,15 @@ class SPBackupApp(WxAsyncApp):
         Args:
             playlist_id (int): the ID of the playlist too recieve
         """
+        # pages from the previous playlist are no use anymore
+        self.cancel_prefetch()
+        SpotifyState.clear_page_cache()
         try:
             playlist: Playlist = await spotify.net.get_playlist(
                 UserState.get_token(), playlist_id)
             SpotifyState.set_playlist(playlist)
             wx.CallAfter(UI.tracksctrl.populate, tracks=playlist.tracks)
+            self.prefetch_adjacent_pages(playlist.tracks)
         except spotify.net.SpotifyError as err:
             SpotifyState.set_playlist(None)
             self.handle_spotify_error(error=err)
@@ -140,17 +346,69 @@ class SPBackupApp(WxAsyncApp):
         """sends the next or previous link found in the PlaylistsInfo.Tracks object
         uodates the global tracks state and loads the PlaylistListCtrl with the tracks
 
+        the page is loaded straight from the page cache if it has been prefetched
+
         Args:
             url (str): the url to follow. found in State.playlistinfo.tracks
         """
+        # user requests go first. a prefetch of this url is kept as the request is shared
+        self.cancel_prefetch(keep=url)
         try:
-            tracks: ExtendedTracks = \
-                await spotify.net.get_playlist_tracks_from_url(UserState.get_token(), url)
+            tracks: ExtendedTracks = SpotifyState.get_cached_page(url)
+            if tracks is None:
+                tracks = await spotify.net.get_playlist_tracks_from_url(
+                    UserState.get_token(), url)
+                SpotifyState.cache_page(url, tracks)
             SpotifyState.update_playlist_tracks(tracks)
             wx.CallAfter(UI.tracksctrl.populate, tracks=tracks)
+            self.prefetch_adjacent_pages(tracks)
         except spotify.net.SpotifyError as err:
             self.handle_spotify_error(error=err)
 
+    def prefetch_adjacent_pages(self, tracks: ExtendedTracks):
+        """requests the next and previous pages in the background and stores them
+        in the SpotifyState page cache
+
+        Args:
+            tracks (ExtendedTracks): the page being displayed
+        """
+        for url in (tracks.next, tracks.previous):
+            if not url or url in self.prefetch_tasks or SpotifyState.get_cached_page(url):
+                continue
+            self.prefetch_tasks[url] = asyncio.create_task(self.prefetch_tracks(url))
+
+    async def prefetch_tracks(self, url: str):
+        """background request for a page of tracks. Errors are ignored as the
+        page will be requested again if the user navigates to it
+
+        Args:
+            url (str): the next or previous url
+        """
+        try:
+            # give any request the user has just started the chance to go first
+            await asyncio.sleep(PREFETCH_DELAY)
+            tracks: ExtendedTracks = await spotify.net.get_playlist_tracks_from_url(
+                UserState.get_token(), url)
+            SpotifyState.cache_page(url, tracks)
+        except spotify.net.SpotifyError as err:
+            globals.logger.console(f"Prefetch of {url} failed. {err.response_text}", "warning")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            globals.logger.console(f"Prefetch of {url} failed. {err.__str__()}", "warning")
+        finally:
+            if self.prefetch_tasks.get(url) is asyncio.current_task():
+                del self.prefetch_tasks[url]
+
+    def cancel_prefetch(self, keep: str = None):
+        """cancels the background page requests
+
+        Args:
+            keep (str, optional): url of a prefetch to leave running. Defaults to None.
+        """
+        for url, task in list(self.prefetch_tasks.items()):
+            if url != keep:
+                task.cancel()
+                del self.prefetch_tasks[url]
+
     async def retrieve_playlist_items(self, url: str):
         """requests for the next or previous url found in the playlists.next or playlists.previous properties.
         called when the User presses on the next or previous button. For pagination if more usbers playlists exceed spotify maximum limit
@@ -178,6 +436,7 @@ class SPBackupApp(WxAsyncApp):
         if error.code == spotify.constants.STATUS_BAD_TOKEN:
             # bad token ask for a re-authorize request from the user
             wx.CallAfter(UI.statusbar.SetStatusText, text=error.response_text)
+            self.cancel_token_refresh()
             globals.token.remove()
             self.start_listening_for_redirect()
         elif error.code == spotify.constants.STATUS_BAD_OAUTH_REQUEST:
@@ -198,10 +457,10 @@ class SPBackupApp(WxAsyncApp):
             value (any): depends on status. If an error then it will be error object else json
         """
         if state == AuthListenerState.EVENT_TOKEN_RECIEVED:
-            # We have authentication save the token and use until 401 error again and restart this process again to obtain another token
+            # We have authentication save the token and refresh it before it expires
+            # value is the token info from spotify.net.exchange_code_for_token
             # save the token to file
-            globals.token.save(value)
-            UserState.set_token(value)
+            self.store_token(value)
             globals.logger.console(
                 "Response from RedirectListener: Token recieved and saved", "info")
             wx.CallAfter(self.destroy_auth_dialog)
@@ -213,9 +472,10 @@ class SPBackupApp(WxAsyncApp):
             # Could just call asyncio.run(self.retrieve_user_and_playlists(value)) instead
             # Im going to remove threading method and replace with async in a later version
             # but for now this works!!!
+            wx.CallAfter(self.schedule_token_refresh)
             wx.CallAfter(
                 lambda *args: asyncio.get_event_loop().create_task(
-                    self.retrieve_user_and_playlists(value)))
+                    self.retrieve_user_and_playlists(value["access_token"])))
         elif state == AuthListenerState.EVENT_AUTHORIZATION_ERROR:
             # There was an issue with the Authorization response and HTTP parsing
             UserState.set_token(None)
@@ -227,14 +487,14 @@ class SPBackupApp(WxAsyncApp):
             # Prompt user to follow Url
             globals.logger.console(
                 "Response from RedirectListener: Requesting Authorization...", "info")
-            loop = asyncio.new_event_loop()
-            url = loop.run_until_complete(spotify.net.authorize(
-                globals.config.CLIENT_ID,
-                (spotify.constants.PLAYLIST_MODIFY_PUBLIC,
-                 spotify.constants.PLAYLIST_MODIFY_PRIVATE,
-                 spotify.constants.PLAYLIST_READ_COLLABORATIVE,
-                 spotify.constants.PLAYLIST_READ_PRIVATE)
-            ))
+            url = spotify.net.await_on_sync_call(
+                spotify.net.authorize,
+                client_id=globals.config.CLIENT_ID,
+                scopes=(spotify.constants.PLAYLIST_MODIFY_PUBLIC,
+                        spotify.constants.PLAYLIST_MODIFY_PRIVATE,
+                        spotify.constants.PLAYLIST_READ_COLLABORATIVE,
+                        spotify.constants.PLAYLIST_READ_PRIVATE)
+            )
             wx.CallAfter(self.open_auth_dialog, url=url)
         # Error handling
         # usually a auth error
@@ -285,6 +545,14 @@ class SPBackupApp(WxAsyncApp):
         # Destroy the dialog
         dlg.Destroy()
 
+    async def shutdown(self):
+        """called once the MainLoop has finished. Closes the pooled Spotify connections
+        and the response cache
+        """
+        await spotify.net.close_client()
+        spotify.cache.close_cache()
+        self.playlist_manager.close()
+
     def playlists_backup_handler(self, event: playlist_manager.BackupEventType, data: dict):
         """handler called from within the playlist_manager backup coroutine function
 
@@ -294,11 +562,33 @@ class SPBackupApp(WxAsyncApp):
         """
         if event == playlist_manager.BackupEventType.BACKUP_SUCCESS:
             print("Backup has been complete")
+        elif event == playlist_manager.BackupEventType.BACKUP_PARTIAL:
+            UI.statusbar.SetStatusText(
+                f"Backup complete but {data['errors']} playlists could not be fetched: {', '.join(data['failed'])}")
         elif event == playlist_manager.BackupEventType.BACKUP_ERROR:
             print(data["error"])
         elif event == playlist_manager.BackupEventType.BACKUP_PLAYLIST_ADDED:
             print(f'Playlist has been added: {data["playlist"].name}')
 
+    def playlists_restore_handler(self, event: playlist_manager.BackupEventType, data: dict):
+        """handler called from within the playlist_manager restore coroutine function
+
+        Args:
+            event (playlist_manager.BackupEventType): one of the RESTORE events
+            data (dict): dict depending on the event will contain data related to it
+        """
+        if event == playlist_manager.BackupEventType.RESTORE_SUCCESS:
+            if data["errors"]:
+                UI.statusbar.SetStatusText(
+                    f"{data['errors']} playlists failed. Restore the backup again to carry on")
+            else:
+                UI.statusbar.SetStatusText(
+                    f"Restored {data['playlists']} playlists with {data['tracks']} tracks")
+        elif event == playlist_manager.BackupEventType.RESTORE_ERROR:
+            print(data["error"])
+        elif event == playlist_manager.BackupEventType.RESTORE_PLAYLIST_ADDED:
+            UI.statusbar.SetStatusText(f'Playlist has been restored: {data["playlist"].name}')
+
 
 def add_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
@@ -330,7 +620,12 @@ async def run_app():
         title=f"{globals.config.APP_NAME} v{globals.config.APP_VERSION} - coded by {globals.config.APP_AUTHOR}")
     UI.main_frame.Show()
     app.run_background_auth_check()
+    watchdog = globals.watchdog.LoopWatchdog()
+    watchdog.start()
     await app.MainLoop()
+    watchdog.stop()
+    globals.logger.console(f"Event loop watchdog: {watchdog.stats()}")
+    await app.shutdown()
 
 if __name__ == '__main__':
     asyncio.run(run_app())
@@ -0,0 +1,283 @@
+"""
+backup_archive.py - exports a backup from playlists.db to a compressed JSON Lines archive
+and reads them back for PlaylistManager.import_backup
+
+The archive is one JSON object per line:
+    {"type": "backup", "version": 1, "name": ..., "description": ..., "date_added": ...}
+    {"type": "playlist", "playlist_id": ..., "uri": ..., "name": ..., ...}
+    {"type": "track", "uri": ..., "name": ..., "album": {"id": ..., "name": ...}, "artists": [...]}
+every playlist line is followed by its tracks in order. The album and artist id is the
+Spotify ID or name:<name> for local files, the same key the Albums and Artists tables use.
+Playlists from a raw backup have their pages parsed into the same track lines
+
+Rows are streamed from the database with generators so only one playlists track_list is
+held in memory. gzip and xz both allow concatenated streams so every worker process
+compresses its own part of the playlists and the parts are joined in order at the end
+"""
+
+import os
+import gzip
+import pathlib
+import itertools
+import json
+import lzma
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Generator, Iterator, List
+
+from playlist_manager import (
+    READ_PAGE_SIZE,
+    catalog_key,
+    decompress_page,
+    read_track_list
+)
+from spotify.validators.tracks import Tracks
+
+ARCHIVE_VERSION = 1
+# compression name: function to open the archive
+COMPRESSION_OPENERS = {
+    "gzip": gzip.open,
+    "xz": lzma.open
+}
+# file extension: compression name
+COMPRESSION_EXTENSIONS = {
+    ".gz": "gzip",
+    ".xz": "xz"
+}
+# worker processes used by export_backup when not given
+EXPORT_PROCESSES = 1
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def compression_from_path(path: str) -> str:
+    """
+    Args:
+        path (str): the archive filename ending in .gz or .xz
+
+    Raises:
+        ArchiveError: if the extension is not known
+
+    Returns:
+        str: gzip or xz
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in COMPRESSION_EXTENSIONS:
+        raise ArchiveError(
+            f"Unknown archive type {extension}. Use one of {', '.join(COMPRESSION_EXTENSIONS)}")
+    return COMPRESSION_EXTENSIONS[extension]
+
+
+def connect_read_only(db_path: str) -> sqlite3.Connection:
+    # every process has its own connection. WAL lets it read while a backup is writing.
+    # as_uri escapes ? # and % in the path and handles Windows drive letters
+    return sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+
+
+def iter_track_records(cursor: sqlite3.Cursor, track_ids: List[int]) -> Generator[dict, None, None]:
+    """reads the tracks from the catalog READ_PAGE_SIZE at a time
+
+    Args:
+        cursor (sqlite3.Cursor): cursor of the backup database
+        track_ids (List[int]): the ordered track_list of a playlist
+
+    Yields:
+        dict: track line of the archive
+    """
+    for start in range(0, len(track_ids), READ_PAGE_SIZE):
+        page = track_ids[start:start + READ_PAGE_SIZE]
+        unique_ids = list(set(page))
+        placeholders = ",".join("?" * len(unique_ids))
+        cursor.execute(f'''
+        SELECT Tracks.id, Tracks.uri, Tracks.name, Albums.spotify_id, Albums.name FROM Tracks
+        LEFT JOIN Albums ON Albums.id = Tracks.album_id
+        WHERE Tracks.id IN ({placeholders})''', unique_ids)
+        records = {}
+        for track_id, uri, name, album_id, album_name in cursor:
+            records[track_id] = {
+                "type": "track", "uri": uri, "name": name,
+                "album": {"id": album_id, "name": album_name} if album_id is not None else None,
+                "artists": []}
+        cursor.execute(f'''
+        SELECT TrackArtists.track_id, Artists.spotify_id, Artists.name FROM TrackArtists
+        JOIN Artists ON Artists.id = TrackArtists.artist_id
+        WHERE TrackArtists.track_id IN ({placeholders})
+        ORDER BY TrackArtists.track_id, TrackArtists.position''', unique_ids)
+        for track_id, artist_id, artist_name in cursor:
+            records[track_id]["artists"].append({"id": artist_id, "name": artist_name})
+        for track_id in page:
+            if track_id in records:
+                yield records[track_id]
+
+
+def iter_raw_track_records(cursor: sqlite3.Cursor, playlist_id: int) -> Generator[dict, None, None]:
+    """parses the pages of a raw backup into track lines. Unavailable tracks are
+    left out the same as a catalogued backup
+
+    Args:
+        cursor (sqlite3.Cursor): cursor of the backup database
+        playlist_id (int): the Playlists row holding the pages
+
+    Yields:
+        dict: track line of the archive
+    """
+    # its own cursor so the pages are read one at a time while the tracks are yielded
+    reader = cursor.connection.execute(
+        "SELECT compression, body FROM Pages WHERE playlist_id = ? ORDER BY offset", (playlist_id,))
+    try:
+        for compression, body in reader:
+            for item in Tracks(**json.loads(decompress_page(compression, body))).items:
+                if item.track is None:
+                    continue
+                album = item.track_album
+                yield {"type": "track", "uri": item.track.uri, "name": item.track.name,
+                       "album": {"id": catalog_key(album.id, album.name), "name": album.name},
+                       "artists": [{"id": catalog_key(artist.id, artist.name), "name": artist.name}
+                                   for artist in item.track.artists]}
+    finally:
+        reader.close()
+
+
+def iter_playlist_records(cursor: sqlite3.Cursor, playlist_ids: List[int]) -> Generator[dict, None, None]:
+    """
+    Args:
+        cursor (sqlite3.Cursor): cursor of the backup database
+        playlist_ids (List[int]): Playlists primary keys
+
+    Yields:
+        dict: a playlist line followed by its track lines
+    """
+    for playlist_id in playlist_ids:
+        cursor.execute('''
+        SELECT playlist_id, uri, name, description, total_songs, snapshot_id,
+        COALESCE(source_id, id),
+        EXISTS (SELECT 1 FROM Pages WHERE Pages.playlist_id = COALESCE(source_id, Playlists.id))
+        FROM Playlists WHERE id = ?''', (playlist_id,))
+        row = cursor.fetchone()
+        if row is None:
+            continue
+        yield {"type": "playlist", "playlist_id": row[0], "uri": row[1], "name": row[2],
+               "description": row[3], "total_songs": row[4], "snapshot_id": row[5]}
+        if row[7]:
+            yield from iter_raw_track_records(cursor, row[6])
+        else:
+            yield from iter_track_records(cursor, read_track_list(cursor, row[6]))
+
+
+def write_records(path: str, compression: str, records: Generator[dict, None, None]) -> int:
+    """
+    Returns:
+        int: the amount of lines written
+    """
+    lines = 0
+    with COMPRESSION_OPENERS[compression](path, "wt", encoding="utf-8") as fp:
+        for record in records:
+            fp.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+            fp.write("\n")
+            lines += 1
+    return lines
+
+
+def _export_part(db_path: str, playlist_ids: List[int], part_path: str, compression: str) -> int:
+    # runs in a worker process
+    conn = connect_read_only(db_path)
+    try:
+        return write_records(part_path, compression, iter_playlist_records(conn.cursor(), playlist_ids))
+    finally:
+        conn.close()
+
+
+def export_backup(db_path: str,
+                  backup_id: int,
+                  path: str,
+                  playlist_ids: List[str] = None,
+                  processes: int = EXPORT_PROCESSES) -> int:
+    """exports a backup to a gzip or xz compressed JSON Lines archive
+
+    Args:
+        db_path (str): the users playlists.db
+        backup_id (int): the Backups primary key
+        path (str): the archive to create. The compression is taken from the .gz or .xz extension
+        playlist_ids (List[str], optional): only export these Spotify playlist IDs. Defaults to None.
+        processes (int, optional): worker processes compressing playlists in parallel. Defaults to EXPORT_PROCESSES.
+
+    Raises:
+        ArchiveError: if the backup does not exist or the extension is unknown
+
+    Returns:
+        int: the amount of lines written
+    """
+    compression = compression_from_path(path)
+    conn = connect_read_only(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT name, description, date_added FROM Backups WHERE id = ?", (backup_id,))
+        backup = cursor.fetchone()
+        if backup is None:
+            raise ArchiveError(f"Backup {backup_id} does not exist")
+        # playlists whose tracks were never stored would be imported as empty
+        cursor.execute('''
+        SELECT id, playlist_id FROM Playlists WHERE backup_id = ?
+        AND NOT (snapshot_id IS NULL AND source_id IS NULL AND track_list IS NULL AND delta IS NULL)
+        ORDER BY id''', (backup_id,))
+        rows = [row[0] for row in cursor.fetchall() if playlist_ids is None or row[1] in playlist_ids]
+    finally:
+        conn.close()
+    header = {"type": "backup", "version": ARCHIVE_VERSION,
+              "name": backup[0], "description": backup[1], "date_added": backup[2]}
+    processes = max(1, min(processes, len(rows)))
+    # contiguous slices so joining the parts keeps the playlists in order
+    size = -(-len(rows) // processes) if rows else 0
+    slices = [rows[start:start + size] for start in range(0, len(rows), size)] if rows else []
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as parts_dir:
+        part_paths = [os.path.join(parts_dir, f"part{index}") for index in range(len(slices) + 1)]
+        lines = write_records(part_paths[0], compression, iter([header]))
+        if processes == 1:
+            lines += sum(_export_part(db_path, part, part_path, compression)
+                         for part, part_path in zip(slices, part_paths[1:]))
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = [executor.submit(_export_part, db_path, part, part_path, compression)
+                           for part, part_path in zip(slices, part_paths[1:])]
+                lines += sum(future.result() for future in futures)
+        with open(path, "wb") as archive:
+            for part_path in part_paths:
+                with open(part_path, "rb") as part:
+                    shutil.copyfileobj(part, archive)
+    return lines
+
+
+def iter_archive_records(path: str) -> Generator[dict, None, None]:
+    """reads an archive one line at a time
+
+    Args:
+        path (str): the .gz or .xz archive
+
+    Raises:
+        ArchiveError: if a line is not valid JSON
+
+    Yields:
+        dict: the backup, playlist and track lines in order
+    """
+    compression = compression_from_path(path)
+    with COMPRESSION_OPENERS[compression](path, "rt", encoding="utf-8") as fp:
+        for line_number, line in enumerate(fp, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as err:
+                raise ArchiveError(f"Line {line_number} of {path} is not valid JSON. {err}")
+
+
+def read_batch(records: Iterator[dict], size: int) -> List[dict]:
+    """
+    Returns:
+        List[dict]: the next size records. Empty once the archive is finished
+    """
+    return list(itertools.islice(records, size))
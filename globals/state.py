@@ -5,6 +5,9 @@ state.py
 """
 
 import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
 import wx
 
 from spotify.validators.playlist import Playlist
@@ -25,6 +28,7 @@ class UI:
     playlistinfo_toolbar: wx.Panel = None
     playlists_spw: wx.SplitterWindow = None
     statusbar: wx.StatusBar = None
+    search_ctrl: wx.SearchCtrl = None
     progress_dialog: wx.Dialog = None
 
 
@@ -48,6 +52,8 @@ class UserState(Global):
     """
 
     __token: str = None
+    __refresh_token: str = None
+    __expires_at: float = None
 
     @staticmethod
     def set_token(token: str):
@@ -59,6 +65,34 @@ class UserState(Global):
         with Global.get_lock():
             return UserState.__token
 
+    @staticmethod
+    def set_token_info(token: str, refresh_token: str, expires_at: float):
+        """sets the access token together with its refresh token and expiry time
+
+        Args:
+            token (str): the access token
+            refresh_token (str): used to get a new access token
+            expires_at (float): seconds since the epoch the access token expires
+        """
+        with Global.get_lock():
+            UserState.__token = token
+            UserState.__refresh_token = refresh_token
+            UserState.__expires_at = expires_at
+
+    @staticmethod
+    def get_refresh_token() -> str:
+        with Global.get_lock():
+            return UserState.__refresh_token
+
+    @staticmethod
+    def get_expires_at() -> float:
+        with Global.get_lock():
+            return UserState.__expires_at
+
+# the amount of track pages kept in memory for the tracks view
+MAX_CACHED_PAGES = 10
+
+
 class SpotifyState(Global):
 
     """
@@ -67,6 +101,36 @@ class SpotifyState(Global):
 
     __playlist: Playlist = None 
     __playlists: Playlists = None
+    # least recently used track pages of the loaded playlist keyed by their url
+    __pages: "OrderedDict[str, Any]" = OrderedDict()
+
+    @staticmethod
+    def cache_page(url: str, tracks: Any):
+        """stores a page of tracks. The least recently used page is removed
+        once there are more than MAX_CACHED_PAGES
+
+        Args:
+            url (str): the next or previous url the page was requested from
+            tracks (Any): the Tracks page
+        """
+        with Global.get_lock():
+            SpotifyState.__pages[url] = tracks
+            SpotifyState.__pages.move_to_end(url)
+            while len(SpotifyState.__pages) > MAX_CACHED_PAGES:
+                SpotifyState.__pages.popitem(last=False)
+
+    @staticmethod
+    def get_cached_page(url: str) -> Optional[Any]:
+        with Global.get_lock():
+            tracks = SpotifyState.__pages.get(url)
+            if tracks is not None:
+                SpotifyState.__pages.move_to_end(url)
+            return tracks
+
+    @staticmethod
+    def clear_page_cache():
+        with Global.get_lock():
+            SpotifyState.__pages.clear()
 
     @staticmethod
     def set_playlists(playlists: Playlists):
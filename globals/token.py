@@ -10,20 +10,39 @@ def check_data_dir_exists():
     if not os.path.exists(spotify.debugging.APP_DATA_DIR):
         os.makedirs(spotify.debugging.APP_DATA_DIR)
 
-def save(token: str, path: str = TOKEN_PATH):
+def save(token: str, refresh_token: str = None, expires_at: float = None, path: str = TOKEN_PATH):
+    """saves the access token with the refresh token and the time it expires
+
+    Args:
+        token (str): the access token
+        refresh_token (str, optional): used to get a new access token. Defaults to None.
+        expires_at (float, optional): seconds since the epoch the access token expires. Defaults to None.
+        path (str, optional): Defaults to TOKEN_PATH.
+    """
     check_data_dir_exists()
     with open(path, "w") as fp:
-        fp.write(json.dumps({"token": token}))
+        fp.write(json.dumps({
+            "token": token,
+            "refresh_token": refresh_token,
+            "expires_at": expires_at}))
 
-def load(path: str = TOKEN_PATH):
+def load(path: str = TOKEN_PATH) -> dict:
+    """loads the token. token files saved before refresh tokens were stored
+    will have a refresh_token and expires_at of None
+
+    Returns:
+        dict: token, refresh_token and expires_at
+    """
     check_data_dir_exists()
+    token = {"token": None, "refresh_token": None, "expires_at": None}
     try:
         with open(path, "r") as fp:
-            return json.loads(fp.read())
+            token.update(json.loads(fp.read()))
     except FileNotFoundError:
-        return {"token": None}
+        pass
+    return token
 
 def remove(path: str = TOKEN_PATH):
     check_data_dir_exists()
     if os.path.exists(path):
-        save(None)
\ No newline at end of file
+        save(None, path=path)
@@ -0,0 +1,64 @@
+"""
+watchdog.py - measures how late the event loop wakes up from a short sleep.
+The wx GUI and the backup coroutines share the same loop so anything blocking it
+(sqlite, file IO, heavy parsing) shows up here as a stall
+"""
+
+import asyncio
+import time
+
+import globals.logger
+
+# how often the loop is checked in seconds
+WATCHDOG_INTERVAL = 0.1
+# a wake up later than this is counted as the loop being blocked
+WATCHDOG_THRESHOLD = 0.1
+
+
+class LoopWatchdog:
+
+    def __init__(self, interval: float = WATCHDOG_INTERVAL, threshold: float = WATCHDOG_THRESHOLD) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.total_blocked = 0.0
+        self._task: asyncio.Task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """starts checking the running loop. Must be called from within the loop
+        """
+        if not self.running:
+            self._task = asyncio.create_task(self._watch())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - before - self.interval
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag > self.threshold:
+                self.stalls += 1
+                self.total_blocked += lag
+                globals.logger.console(
+                    f"Event loop was blocked for {lag * 1000:.0f}ms", "warning")
+
+    def stats(self) -> dict:
+        return {"stalls": self.stalls,
+                "max_lag": round(self.max_lag, 3),
+                "total_blocked": round(self.total_blocked, 3)}
+
+    def reset_stats(self):
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.total_blocked = 0.0
@@ -5,15 +5,27 @@ and json
 
 import sqlite3
 import os
+import sys
+import bisect
+import hashlib
+import json
+import zlib
+from collections import Counter
+from array import array
 import asyncio
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import (
     Enum,
     auto as enum_auto
 )
 from typing import (
+    Any,
     Callable,
     Dict,
+    List,
     Union
 )
 from types import AsyncGeneratorType
@@ -50,29 +62,429 @@ Playlist:
     backups_id: int     #foreign key
     name: str
     description: str
+    track_list: bytes   #packed Tracks ids, see pack_track_list
+    base_id: int        #foreign key. previous version when the tracks are stored as a delta
+    delta: bytes        #packed ops, see encode_track_delta
+    delta_depth: int    #deltas since the last track_list
 
 @dataclass
 Track
     id: int
-    playlist_id: int    #foreign key
-    artists_id: int     #foreign key
     album_id: int       #foreign key
-    uri: str
+    uri: str            #unique
     name: str
 
+@dataclass
+TrackArtists:
+    track_id: int       #foreign key
+    artist_id: int      #foreign key
+    position: int
+
+@dataclass
+TrackPlaylists:
+    track_id: int           #foreign key
+    playlist_id: str        #Spotify playlist ID
+    first_backup_id: int    #foreign key. first backup the track was in the playlist
+    last_row_id: int        #foreign key. Playlists row of the newest version holding the track
+
+TrackSearch: FTS5 table of name, artists and album. rowid is the Tracks id
+
 @dataclass
 Artists:
     id: int
+    spotify_id: str     #unique
     name: str
 
 @dataclass
 Album:
     id: int
+    spotify_id: str     #unique
     name: str
 """
 
+# PRAGMA user_version of the newest database layout
+# 1 - Albums and Artists keyed by their Spotify ID with a TrackArtists join table
+# 2 - Tracks is a catalog of unique uris and Playlists store their tracks as a packed track_list
+# 3 - a changed playlist can store a delta against its previous version instead of a track_list
+# 4 - TrackSearch full text index and TrackPlaylists
+# 5 - TrackPlaylists keeps the newest version holding the track as well as the first backup
+SCHEMA_VERSION = 5
+# array typecode of the Playlists.track_list. 4 bytes on every platform we build for
+TRACK_LIST_TYPECODE = "I"
+
+
+def pack_track_list(track_ids: List[int]) -> bytes:
+    """packs the ordered Tracks ids of a playlist into the Playlists.track_list blob.
+    Always stored little endian so the database can be moved between machines
+
+    Args:
+        track_ids (List[int]): ids from the Tracks catalog
+
+    Returns:
+        bytes: 4 bytes per track
+    """
+    track_list = array(TRACK_LIST_TYPECODE, track_ids)
+    if sys.byteorder == "big":
+        track_list.byteswap()
+    return track_list.tobytes()
+
+
+def unpack_track_list(blob: bytes) -> array:
+    """the opposite of pack_track_list
+
+    Args:
+        blob (bytes): Playlists.track_list. Can be None
+
+    Returns:
+        array: the ordered Tracks ids
+    """
+    track_list = array(TRACK_LIST_TYPECODE)
+    if blob:
+        track_list.frombytes(blob)
+        if sys.byteorder == "big":
+            track_list.byteswap()
+    return track_list
+
+
+# Pages.compression of raw backups
+PAGE_COMPRESSION = "zlib"
+# zlib level for raw pages. 6 is the zlib default
+PAGE_COMPRESSION_LEVEL = 6
+# Pages.compression: function to decompress the body
+PAGE_DECOMPRESSORS = {
+    "zlib": zlib.decompress
+}
+
+
+def compress_page(body: bytes) -> bytes:
+    """
+    Args:
+        body (bytes): the json response of a tracks page
+
+    Returns:
+        bytes: the Pages.body blob compressed with PAGE_COMPRESSION
+    """
+    return zlib.compress(body, PAGE_COMPRESSION_LEVEL)
+
+
+def decompress_page(compression: str, blob: bytes) -> bytes:
+    """the opposite of compress_page
+
+    Args:
+        compression (str): Pages.compression
+        blob (bytes): Pages.body
+
+    Raises:
+        ValueError: if the compression is not known
+
+    Returns:
+        bytes: the json response as it was received
+    """
+    if compression not in PAGE_DECOMPRESSORS:
+        raise ValueError(f"Unknown page compression {compression}")
+    return PAGE_DECOMPRESSORS[compression](blob)
+
+
+# bytes of the PageHashes.hash digest
+PAGE_HASH_SIZE = 16
+
+
+def hash_page(body: bytes) -> bytes:
+    """
+    Args:
+        body (bytes): the json response of a tracks page requested with FIELDS_TRACKS_BACKUP_ITEMS
+
+    Returns:
+        bytes: blake2b digest of PAGE_HASH_SIZE bytes
+    """
+    return hashlib.blake2b(body, digest_size=PAGE_HASH_SIZE).digest()
+
+
+def build_search_query(text: str) -> str:
+    """turns what the user typed into a FTS5 query. Every word has to match
+    and the last one is a prefix so results show up while typing
+
+    Args:
+        text (str): the search box text
+
+    Returns:
+        str: empty if there is nothing to search for
+    """
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if not words:
+        return ""
+    words[-1] += "*"
+    return " ".join(words)
+
+
+def read_track_list(cursor: sqlite3.Cursor, playlist_id: int) -> array:
+    """rebuilds the track_list of a Playlists row. Walks back along base_id to the
+    checkpoint then replays the deltas forward. Works on any connection to the backup database
+
+    Args:
+        cursor (sqlite3.Cursor): cursor of the backup database
+        playlist_id (int): the Playlists row holding the tracks
+
+    Returns:
+        array: the ordered Tracks ids
+    """
+    cursor.execute('''
+    WITH RECURSIVE chain(id, base_id, track_list, delta, depth) AS (
+        SELECT id, base_id, track_list, delta, 0 FROM Playlists WHERE id = ?
+        UNION ALL
+        SELECT Playlists.id, Playlists.base_id, Playlists.track_list, Playlists.delta, chain.depth + 1
+        FROM Playlists JOIN chain ON Playlists.id = chain.base_id
+    )
+    SELECT track_list, delta FROM chain ORDER BY depth DESC''', (playlist_id,))
+    track_list = array(TRACK_LIST_TYPECODE)
+    for checkpoint, delta in cursor.fetchall():
+        if delta is None:
+            track_list = unpack_track_list(checkpoint)
+        else:
+            track_list = apply_track_delta(track_list, unpack_track_list(delta))
+    return track_list
+
+
+def longest_increasing_subsequence(values: List[int]) -> List[int]:
+    """finds the longest strictly increasing run of values that keeps their order. O(n log n)
+
+    Args:
+        values (List[int]): for example the old positions of tracks listed in their new order
+
+    Returns:
+        List[int]: indexes into values of the subsequence
+    """
+    # tails[length - 1] is the index of the smallest value ending a run of that length
+    tails: List[int] = []
+    tail_values: List[int] = []
+    previous = [-1] * len(values)
+    for index, value in enumerate(values):
+        length = bisect.bisect_left(tail_values, value)
+        if length > 0:
+            previous[index] = tails[length - 1]
+        if length == len(tails):
+            tails.append(index)
+            tail_values.append(value)
+        else:
+            tails[length] = index
+            tail_values[length] = value
+    subsequence = []
+    index = tails[-1] if tails else -1
+    while index != -1:
+        subsequence.append(index)
+        index = previous[index]
+    subsequence.reverse()
+    return subsequence
+
+
+def diff_track_lists(old: List[int], new: List[int]) -> tuple:
+    """compares two versions of a playlist
+
+    Args:
+        old (List[int]): the older track_list
+        new (List[int]): the newer track_list
+
+    Returns:
+        tuple: (added, removed, moved) lists of Tracks ids. Duplicates are counted.
+        moved are the tracks in both that are outside the longest run still in the same order
+    """
+    old_counts, new_counts = Counter(old), Counter(new)
+    added = list((new_counts - old_counts).elements())
+    removed = list((old_counts - new_counts).elements())
+    # pair the nth copy of a track in new with the nth copy in old
+    old_positions: Dict[int, List[int]] = {}
+    for position, track_id in enumerate(old):
+        old_positions.setdefault(track_id, []).append(position)
+    seen: Dict[int, int] = {}
+    common_ids, common_positions = [], []
+    for track_id in new:
+        occurrence = seen.get(track_id, 0)
+        positions = old_positions.get(track_id, ())
+        if occurrence < len(positions):
+            common_ids.append(track_id)
+            common_positions.append(positions[occurrence])
+        seen[track_id] = occurrence + 1
+    in_order = set(longest_increasing_subsequence(common_positions))
+    moved = [track_id for index, track_id in enumerate(common_ids) if index not in in_order]
+    return added, removed, moved
+
+
+def diff_track_uris(live: List[str], backup: List[str]) -> tuple:
+    """the fewest track uris to remove from and add to a live playlist so it holds the
+    same tracks as the backup. Spotify removes every copy of a uri so a track with
+    more copies live than in the backup is removed and the copies it should have are added back
+
+    Args:
+        live (List[str]): uris in the playlist now
+        backup (List[str]): uris in the backup
+
+    Returns:
+        tuple: (removes, adds). removes has no duplicates. adds are in backup order
+    """
+    live_counts, backup_counts = Counter(live), Counter(backup)
+    removes = [uri for uri, count in live_counts.items() if count > backup_counts[uri]]
+    removed = set(removes)
+    kept = {uri: 0 if uri in removed else live_counts[uri] for uri in backup_counts}
+    adds = []
+    for uri in backup:
+        if kept[uri]:
+            kept[uri] -= 1
+        else:
+            adds.append(uri)
+    return removes, adds
+
+
+def plan_track_moves(current: List[str], target: List[str]) -> List[tuple]:
+    """the range moves that put a playlist in the target order. The longest run of tracks
+    already in target order stays where it is and only the tracks outside it are moved.
+    Tracks next to each other in both orders are moved together in one range
+
+    Args:
+        current (List[str]): the uris in the playlist now
+        target (List[str]): the same uris in the order they should be
+
+    Returns:
+        List[tuple]: (range_start, insert_before, range_length) to send in order.
+        insert_before is counted before each move is made, the same as the Spotify API
+
+    every move is found by searching the playlist as it is after the moves before it, so a
+    heavily shuffled playlist is O(n^2). Call it from an executor rather than the event loop
+    """
+    target_positions: Dict[str, List[int]] = {}
+    for position, uri in enumerate(target):
+        target_positions.setdefault(uri, []).append(position)
+    # pair the nth copy of a track in current with the nth copy in target
+    seen = Counter()
+    order = []
+    for uri in current:
+        order.append(target_positions[uri][seen[uri]])
+        seen[uri] += 1
+    in_place = {order[index] for index in longest_increasing_subsequence(order)}
+    moves = []
+    position = 0
+    while position < len(order):
+        if position in in_place:
+            position += 1
+            continue
+        start = order.index(position)
+        length = 1
+        while (position + length not in in_place and start + length < len(order)
+               and order[start + length] == position + length):
+            length += 1
+        # straight after the track before it in the target order
+        insert_before = order.index(position - 1) + 1 if position else 0
+        if not start <= insert_before <= start + length:
+            moves.append((start, insert_before, length))
+            block = order[start:start + length]
+            del order[start:start + length]
+            if insert_before > start:
+                insert_before -= length
+            order[insert_before:insert_before] = block
+        position += length
+    return moves
+
+
+# a full track_list is stored at least every CHECKPOINT_INTERVAL versions of a playlist
+# so rebuilding an old version never replays more than CHECKPOINT_INTERVAL - 1 deltas
+CHECKPOINT_INTERVAL = 10
+# delta ops. COPY start length copies a run of the previous version.
+# INSERT count id... adds tracks that are not in a copied run.
+# Removed tracks are never copied and moved tracks are copied from their old position
+DELTA_COPY = 0
+DELTA_INSERT = 1
+# shorter runs are cheaper as part of an INSERT than as their own COPY
+MIN_COPY_LENGTH = 3
+
+
+def encode_track_delta(old: List[int], new: List[int]) -> array:
+    """encodes new as COPY and INSERT ops against old. Runs of tracks are matched greedily,
+    following on from the previous run first so an unchanged stretch is a single COPY
+
+    Args:
+        old (List[int]): the track_list of the previous version
+        new (List[int]): the track_list being stored
+
+    Returns:
+        array: the ops. Pack with pack_track_list
+    """
+    positions: Dict[int, int] = {}
+    for index, track_id in enumerate(old):
+        positions.setdefault(track_id, index)
+    delta = array(TRACK_LIST_TYPECODE)
+    inserts: List[int] = []
+
+    def flush_inserts():
+        if inserts:
+            delta.extend((DELTA_INSERT, len(inserts)))
+            delta.extend(inserts)
+            inserts.clear()
+
+    next_old = 0
+    index = 0
+    while index < len(new):
+        track_id = new[index]
+        if next_old < len(old) and old[next_old] == track_id:
+            start = next_old
+        else:
+            start = positions.get(track_id)
+        length = 0
+        if start is not None:
+            while index + length < len(new) and start + length < len(old) and \
+                    old[start + length] == new[index + length]:
+                length += 1
+        if length < MIN_COPY_LENGTH and start != next_old:
+            inserts.append(track_id)
+            index += 1
+            continue
+        flush_inserts()
+        delta.extend((DELTA_COPY, start, length))
+        next_old = start + length
+        index += length
+    flush_inserts()
+    return delta
+
+
+def apply_track_delta(old: List[int], delta: List[int]) -> array:
+    """the opposite of encode_track_delta
+
+    Args:
+        old (List[int]): the track_list the delta was encoded against
+        delta (List[int]): the ops
+
+    Returns:
+        array: the track_list
+    """
+    track_list = array(TRACK_LIST_TYPECODE)
+    index = 0
+    while index < len(delta):
+        if delta[index] == DELTA_COPY:
+            start, length = delta[index + 1], delta[index + 2]
+            track_list.extend(old[start:start + length])
+            index += 3
+        else:
+            count = delta[index + 1]
+            track_list.extend(delta[index + 2:index + 2 + count])
+            index += 2 + count
+    return track_list
+
+# amount of playlists having their tracks fetched at the same time during a backup
 MAX_PLAYLISTS_CONNECT = 5
-MAX_TRACKS_CONNECT = 5
+# playlists written at the same time during a restore. They all share spotify.net.governor
+MAX_PLAYLISTS_RESTORE = 5
+# local files can not be added to a playlist through the API
+LOCAL_TRACK_PREFIX = "spotify:local:"
+# pages waiting to be written. The fetch workers wait when the queue is full
+MAX_QUEUED_PAGES = 32
+# the most write jobs the writer stores in a single transaction
+WRITE_BATCH_SIZE = 64
+# page cache of the backup database connection in KiB
+SQLITE_CACHE_KB = 64 * 1024
+# rows read from the database per query when streaming tracks
+READ_PAGE_SIZE = 500
+# the most tracks returned by search_tracks
+MAX_SEARCH_RESULTS = 50
+# archive lines written per transaction by import_backup
+IMPORT_BATCH_SIZE = 5000
 
 
 def retry_on_exception(max_retries: int, error_handler: Callable[[str], None] = None):
@@ -118,6 +530,15 @@ def retry_on_exception(max_retries: int, error_handler: Callable[[str], None] =
     return decorator
 
 
+class DiffType(Enum):
+    """what changed about a playlist between two backups
+    """
+
+    PLAYLIST_ADDED = enum_auto()
+    PLAYLIST_DELETED = enum_auto()
+    PLAYLIST_CHANGED = enum_auto()
+
+
 class BackupEventType(Enum):
     """for our function callback
 
@@ -126,6 +547,8 @@ class BackupEventType(Enum):
     """
 
     BACKUP_SUCCESS = enum_auto()
+    # the backup finished but some playlists could not be fetched
+    BACKUP_PARTIAL = enum_auto()
     BACKUP_ERROR = enum_auto()
     BACKUP_PLAYLIST_ADDED = enum_auto()
     BACKUP_PLAYLIST_STARTED = enum_auto()
@@ -135,32 +558,303 @@ class BackupEventType(Enum):
     BACKUP_TRACKS_SUCCESS = enum_auto()
     BACKUP_TRACKS_ERROR = enum_auto()
     BACKUP_TRACKS_ADDED = enum_auto()
+    RESTORE_SUCCESS = enum_auto()
+    RESTORE_ERROR = enum_auto()
+    RESTORE_PLAYLIST_ADDED = enum_auto()
+    RESTORE_PLAYLIST_ERROR = enum_auto()
 
 
-class BackupSQlite:
+def check_not_on_event_loop():
+    """the wxasync loop is shared with the GUI so any sqlite call there freezes the app
 
-    """Backup Context Manager for connecting to the database
+    Raises:
+        RuntimeError: if called from a thread running an event loop
     """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    raise RuntimeError("SQlite IO is running on the event loop. Use the PlaylistManager.storage")
 
-    def __init__(self, filepath) -> None:
-        self.filepath = filepath
 
-    def __enter__(self, *args, **kwargs) -> sqlite3.Cursor:
-        self.conn = sqlite3.connect(self.filepath)
-        return self.conn.cursor()
+class BackupStorage:
 
-    def __exit__(self, type: Exception, value: any, exception: object):
-        if type:
-            message = f'Error handling SQlite IO: {type}, {value}, {exception}'
-            globals.logger.console(message, "error")
-        self.conn.commit()
-        self.conn.close()
-        return True
+    """runs every sqlite call for the backup database on its own thread so the event loop
+    shared with the GUI is never blocked. The async code awaits the results.
+    The thread keeps a single connection open for the life of the storage
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.commits = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="BackupStorage")
+        self._conn: sqlite3.Connection = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # only ever called from the storage thread
+        if self._conn is None:
+            # isolation_level None so the transactions are only the ones we BEGIN ourselves
+            self._conn = sqlite3.connect(
+                self.db_path, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # safe with WAL, a power cut can only lose the last transactions not corrupt the file
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+            self._conn.execute("PRAGMA temp_store=MEMORY")
+        return self._conn
+
+    def _transaction(self, func: Callable[..., Any], args: tuple) -> Any:
+        check_not_on_event_loop()
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            result = func(cursor, *args)
+            cursor.execute("COMMIT")
+            self.commits += 1
+            return result
+        except Exception as err:
+            globals.logger.console(f'Error handling SQlite IO: {type(err)}, {err}', "error")
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    async def transaction(self, func: Callable[..., Any], *args) -> Any:
+        """calls func(cursor, *args) inside a single transaction on the storage thread.
+        Rolls back if func raises
+
+        Args:
+            func (Callable[..., Any]): takes a sqlite3.Cursor and args
+
+        Raises:
+            sqlite3.Error: or whatever func raised, after the transaction has been rolled back
+
+        Returns:
+            Any: whatever func returns
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._transaction, func, args)
+
+    def _vacuum(self):
+        self._connect().execute("VACUUM")
+
+    async def vacuum(self):
+        """rebuilds the database file to free the space left by deleted rows.
+        Can not run inside a transaction
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._vacuum)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def close(self):
+        """waits for any queued transactions, closes the connection then stops the storage thread
+        """
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=True)
 
 
 BACKUP_CALLBACK_TYPE = Callable[[BackupEventType, Union[Dict, str]], None]
 
 
+class WriteJobType(Enum):
+    """what the backup writer should do with a WriteJob
+    """
+
+    PLAYLIST_STARTED = enum_auto()
+    PLAYLIST_TRACKS = enum_auto()
+    # a raw backup page
+    PLAYLIST_PAGE = enum_auto()
+    # a page with the same hash as the previous version. Its tracks are copied from there
+    PLAYLIST_PAGE_UNCHANGED = enum_auto()
+    PLAYLIST_FINISHED = enum_auto()
+    PLAYLIST_UNCHANGED = enum_auto()
+    # the tracks could not be fetched. The Playlists row points to the last stored version instead
+    PLAYLIST_FAILED = enum_auto()
+
+
+@dataclass
+class WriteJob:
+    """passed from the fetch workers to the writer during a backup
+    """
+
+    type: WriteJobType
+    # position of the playlist in the backup. The writer maps it to the Playlists row
+    key: int
+    playlist: PlaylistItem = None
+    items: List[TrackItem] = None
+    # the response body and offset of a PLAYLIST_PAGE
+    body: bytes = None
+    offset: int = None
+    # hash of the PLAYLIST_TRACKS or PLAYLIST_PAGE_UNCHANGED page
+    page_hash: bytes = None
+    # (first index, count) of the tracks of a PLAYLIST_PAGE_UNCHANGED in the base_id track_list
+    base_range: tuple = None
+    # the Playlists row holding the tracks of an unchanged playlist
+    source_id: int = None
+    # the Playlists row holding the previous version of a changed playlist
+    base_id: int = None
+
+
+@dataclass
+class StoredBackup:
+    id: int
+    name: str
+    description: str
+    date_added: str
+
+
+@dataclass
+class StoredPlaylist:
+    id: int
+    playlist_id: str
+    uri: str
+    name: str
+    description: str
+    total_songs: int
+    backup_id: int
+    snapshot_id: str
+    # the Playlists row holding the tracks. Same as id unless the playlist was unchanged
+    tracks_id: int
+    # the tracks are stored as raw pages. check PlaylistManager.iter_raw_pages
+    raw: bool = False
+    # False when the backup stopped before the tracks were stored
+    complete: bool = True
+
+
+@dataclass
+class StoredTrack:
+    id: int
+    uri: str
+    name: str
+    album: str
+    artists: List[str]
+
+
+@dataclass
+class SearchPlaylist:
+    """a playlist a search result has been in
+    """
+
+    name: str
+    # the first and the newest backup with the track in the playlist
+    first_backup: StoredBackup
+    last_backup: StoredBackup
+
+
+@dataclass
+class SearchResult:
+    track: StoredTrack
+    # Spotify playlist ID of every playlist the track has been in
+    playlists: Dict[str, SearchPlaylist] = field(default_factory=dict)
+
+
+@dataclass
+class PlaylistDiff:
+    """one playlist that is different between two backups. The track lists are
+    only filled in for PLAYLIST_CHANGED
+    """
+
+    type: DiffType
+    # the newer version or the older one if the playlist was deleted
+    playlist: StoredPlaylist
+    added: List[StoredTrack] = field(default_factory=list)
+    removed: List[StoredTrack] = field(default_factory=list)
+    moved: List[StoredTrack] = field(default_factory=list)
+
+
+@dataclass
+class CatalogIds:
+    """Spotify ID to row ID of the Albums, Artists and Tracks already stored.
+    Kept by the writer for the whole backup so shared albums, artists and tracks are only looked up once
+    """
+
+    albums: Dict[str, int] = field(default_factory=dict)
+    artists: Dict[str, int] = field(default_factory=dict)
+    # keyed by the track uri
+    tracks: Dict[str, int] = field(default_factory=dict)
+
+    def clear(self):
+        self.albums.clear()
+        self.artists.clear()
+        self.tracks.clear()
+
+
+@dataclass
+class CatalogTrack:
+    """a track on its way into the catalog. The keys come from catalog_key
+    """
+
+    uri: str
+    name: str
+    album_key: str
+    album_name: str
+    # (key, name) of every artist in order
+    artists: List[tuple]
+
+
+@dataclass
+class PendingPlaylist:
+    """a playlist the writer is still receiving pages for
+    """
+
+    # primary key of the Playlists row
+    row_id: int
+    # the previous version to delta encode against
+    base_id: int = None
+    track_list: array = field(default_factory=lambda: array(TRACK_LIST_TYPECODE))
+    # raw pages stored. The track_list stays empty for a raw backup
+    pages: int = 0
+    # (offset, hash, first index, count) of every hashed page. Stored in PageHashes
+    page_hashes: List[tuple] = field(default_factory=list)
+    # read from base_id the first time a page is unchanged
+    base_track_list: array = None
+    # set by import_backup. The writer gets these from the WriteJob
+    playlist_id: str = None
+    snapshot_id: str = None
+
+
+@dataclass
+class ImportState:
+    """carried between the batches of import_backup
+    """
+
+    backup_id: int = None
+    playlist: PendingPlaylist = None
+    catalog: CatalogIds = field(default_factory=CatalogIds)
+    playlists: int = 0
+    tracks: int = 0
+
+
+@dataclass
+class RestoreProgress:
+    """a playlist in the restore journal
+    """
+
+    # the Playlists row being restored
+    playlist_id: int
+    # Spotify ID of the playlist the tracks are written to. None until it has been created
+    target_id: str = None
+    # tracks already written. An interrupted restore carries on from here
+    tracks_added: int = 0
+    finished: bool = False
+
+
+def catalog_key(spotify_id: str, name: str) -> str:
+    """the unique key of an album or artist. Local files and rows migrated from
+    databases before SCHEMA_VERSION 1 have no Spotify ID so they are keyed by name
+
+    Returns:
+        str: the Spotify ID or name:<name>
+    """
+    return spotify_id if spotify_id else f"name:{name}"
+
+
 def on_error_handler(err: Exception):
     globals.logger.console(f"Failed to connect. Reason: {err.__str__()}")
 
@@ -174,27 +868,20 @@ class PlaylistManager:
         global PLAYLIST_DIR
         self.user: SpotifyUser = None
         self.db_path: str = ""
+        # all sqlite IO goes through here. created with the database in create_backup_directory
+        self.storage: BackupStorage = None
+        # False if the sqlite library was built without FTS5
+        self.search_enabled = False
         PLAYLIST_DIR = os.path.join(
             spotify.debugging.APP_SETTINGS_DIR, PLAYLIST_PATHNAME)
         self.app_callback: BACKUP_CALLBACK_TYPE = None
 
-    # @retry_on_exception(max_retries=3, error_handler=on_error_handler)
-    async def _tracks(self, token: str, playlist_id: int, limit: int):
-        offset = 0
-        tracks = await spotify.net.get_playlist_tracks(
-            access_token=token, playlist_id=playlist_id, offset=offset, limit=limit)
-        track_counter = tracks.total
-        total_tracks = tracks.total
-        while track_counter > 0:
-            for track in tracks.items:
-                yield track
-            offset += limit
-            if offset > total_tracks:
-                break
-            # need to fix the bug this function is not correct
-            tracks = await spotify.net.get_playlist_tracks(
-                token, playlist_id, offset, limit)
-            track_counter -= len(tracks.items)
+    async def _tracks(self,
+                      token: str,
+                      playlist_id: int,
+                      limit: int = spotify.net.MAX_TRACKS_PAGE_LIMIT):
+        async for track in spotify.net.get_all_track_items(token, playlist_id, limit=limit):
+            yield track
 
     # @retry_on_exception(max_retries=3, error_handler=on_error_handler)
     async def _playlists(self, token: str, limit: int) -> PlaylistItem:
@@ -226,52 +913,647 @@ class PlaylistManager:
                                token: str,
                                backup_name: str,
                                backup_description: str,
-                               limit: int = 50):
+                               limit: int = 50,
+                               raw: bool = False):
         """where the backup begins and the main coroutine task handler
 
+        the backup runs as a pipeline. MAX_PLAYLISTS_CONNECT fetch workers request the
+        tracks of a playlist each and push the pages into a bounded queue. A single writer drains
+        the queue and stores the pages in batched transactions. When the writer falls behind the
+        full queue holds the workers back so memory stays flat.
+
+        playlists whose snapshot_id matches the newest stored version are not requested again.
+        The new Playlists row points to the stored tracks with its source_id instead
+
+        a raw backup stores every page exactly as Spotify sent it, zlib compressed in the Pages table.
+        Nothing is validated or added to the catalog so it runs as fast as the pages download.
+        The pages are parsed when they are read with iter_raw_pages or exported. Raw playlists are
+        left out of the track search and Compare Backups as they are not in the catalog
+
         Args:
             callback (BACKUP_CALLBACK_TYPE): the callback to send data back to
             token (str): the authenticating spotify token
             backup_name (str): the name of the backup to be added to the database
             backup_description (str): the description of the backup entry
             limit (int, optional): maximum number of playlists in every HTTP response. Defaults to 50.
+            raw (bool, optional): store the pages uncatalogued. Defaults to False.
         """
         # callback to the main event handler
         self.app_callback = callback
-        # create a backup entry to the sqlite3 database
-        backup_id: int = await self.add_backup(backup_name, backup_description)
-        # temporary storage for holding tasks
-        self.playlist_tasks = []
-        self.track_tasks = []
         try:
-            async for playlist in await self._playlists(token, limit):
-                # callback(BackupEventType.BACKUP_PLAYLIST_ADDED, {"playlist": playlist})
-                playlist_id = await self.insert_playlist_db(playlist, backup_id)
-                self.playlist_tasks.append(
-                    self.insert_playlist_db(playlist, backup_id))
-                tracks = self._tracks(
-                    token=token, playlist_id=playlist.id, limit=50)
-                async for track_item in tracks:
-                    self.track_tasks.append(
-                        self.insert_track_db(item=track_item, playlist_id=playlist_id))
-                    # self.track_tasks.append(print(track_item.track.name))
-                if len(self.playlist_tasks) >= MAX_PLAYLISTS_CONNECT:
-                    # gather will call create_task automatically
-                    await asyncio.gather(*self.playlist_tasks)
-                    self.playlist_tasks = []
-                if len(self.track_tasks) >= MAX_TRACKS_CONNECT:
-                    # gather will call create_task automatically
-                    return_exceptions = await asyncio.gather(*self.track_tasks)
-                    self.track_tasks = []
-            if self.playlist_tasks:
-                return_exceptions = await asyncio.gather(*self.playlist_tasks)
-                globals.logger.console(return_exceptions.__str__(), "error")
-            if self.track_tasks:
-                await asyncio.gather(*self.track_tasks)
-
-            callback(BackupEventType.BACKUP_SUCCESS, {})
+            # create a backup entry to the sqlite3 database
+            backup_id: int = await self.add_backup(backup_name, backup_description)
+            # snapshot_id and row of the newest stored version of every playlist
+            stored_versions = await self.get_latest_playlist_versions(raw)
+        except sqlite3.Error as err:
+            callback(BackupEventType.BACKUP_ERROR, {"error": err})
+            return
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUED_PAGES)
+        stats = {"playlists": 0, "unchanged": 0, "errors": 0, "failed": [], "pages_parsed": 0, "pages_unchanged": 0}
+        commits = self.storage.commits
+        fetching = asyncio.create_task(
+            self._fetch_playlists(token, limit, write_queue, stored_versions, stats, raw))
+        writing = asyncio.create_task(
+            self._write_playlists(write_queue, backup_id, stats))
+        try:
+            await asyncio.gather(fetching, writing)
+            stats["commits"] = self.storage.commits - commits
+            pages = stats["pages_parsed"] + stats["pages_unchanged"]
+            stats["page_hit_rate"] = stats["pages_unchanged"] / pages if pages else 0.0
+            globals.logger.console(
+                f"Backup complete. {stats['unchanged']} of {stats['playlists']} playlists were unchanged "
+                f"since the last backup. {stats['pages_unchanged']} of {pages} pages were unchanged "
+                f"({stats['page_hit_rate']:.0%}). {stats['commits']} database commits. "
+                f"Requests saved: {spotify.net.get_client().stats()}")
+            if stats["errors"]:
+                callback(BackupEventType.BACKUP_PARTIAL, stats)
+            else:
+                callback(BackupEventType.BACKUP_SUCCESS, stats)
         except Exception as err:
             globals.logger.console(err.__str__(), "error")
+            fetching.cancel()
+            writing.cancel()
+            try:
+                await self.storage.transaction(self._discard_incomplete_playlists, backup_id)
+            except sqlite3.Error:
+                # already logged by the storage. The rows are left incomplete
+                pass
+            callback(BackupEventType.BACKUP_ERROR, {"error": err})
+        finally:
+            fetching.cancel()
+            writing.cancel()
+
+    async def _fetch_playlists(self,
+                               token: str,
+                               limit: int,
+                               write_queue: asyncio.Queue,
+                               stored_versions: Dict[str, tuple],
+                               stats: dict,
+                               raw: bool = False):
+        """the fetch stage of the backup. Hands the users playlists to the fetch workers
+        and lets the writer know when every playlist has been fetched
+        """
+        playlist_queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_PLAYLISTS_CONNECT)
+        workers = [
+            asyncio.create_task(
+                self._fetch_worker(token, playlist_queue, write_queue, stored_versions, stats, raw))
+            for _ in range(MAX_PLAYLISTS_CONNECT)]
+        try:
+            key = 0
+            async for playlist in self._playlists(token, limit):
+                await playlist_queue.put((key, playlist))
+                key += 1
+            for _ in workers:
+                await playlist_queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+        # no more jobs for the writer
+        await write_queue.put(None)
+
+    async def _fetch_worker(self,
+                            token: str,
+                            playlist_queue: asyncio.Queue,
+                            write_queue: asyncio.Queue,
+                            stored_versions: Dict[str, tuple],
+                            stats: dict,
+                            raw: bool = False):
+        """requests the tracks of one playlist at a time and pushes every page to the writer.
+        Pages are hashed before they are parsed. A page with the same hash at the same offset in the
+        previous version is not parsed or written, the writer copies its tracks from that version
+        """
+        # raw backups keep every field Spotify returns. The paging fields would change the hash
+        # of every page whenever a track is added or removed so they are left out
+        fields = None if raw else spotify.constants.FIELDS_TRACKS_BACKUP_ITEMS
+        limit = spotify.net.MAX_TRACKS_PAGE_LIMIT
+        while True:
+            entry = await playlist_queue.get()
+            if entry is None:
+                return
+            key, playlist = entry
+            stored = stored_versions.get(playlist.id)
+            if stored is not None and stored[0] == playlist.snapshot_id:
+                # nothing has changed since the last backup. reuse the stored tracks
+                await write_queue.put(WriteJob(
+                    WriteJobType.PLAYLIST_UNCHANGED, key, playlist, source_id=stored[1]))
+                continue
+            base_id = stored[1] if stored is not None and not raw else None
+            await write_queue.put(WriteJob(
+                WriteJobType.PLAYLIST_STARTED, key, playlist, base_id=base_id))
+            base_hashes = await self.get_page_hashes(base_id) if base_id is not None else {}
+            try:
+                offset = 0
+                # the total is known so the pages dont need the paging fields
+                async for page in spotify.net.iter_playlist_track_pages(
+                        token, playlist.id, limit, fields=fields, raw=True, total=playlist.tracks.total):
+                    if raw:
+                        job = WriteJob(WriteJobType.PLAYLIST_PAGE, key, body=page, offset=offset)
+                    else:
+                        job = self._page_job(key, offset, page, base_hashes, stats)
+                    await write_queue.put(job)
+                    offset += limit
+            except (spotify.net.SpotifyError, aiohttp.ClientError, asyncio.TimeoutError) as err:
+                # the playlist is kept in the backup with the last version that was stored
+                await write_queue.put(WriteJob(WriteJobType.PLAYLIST_FAILED, key, playlist))
+                stats["errors"] += 1
+                stats["failed"].append(playlist.name)
+                globals.logger.console(
+                    f"Error backing up playlist {playlist.name}. {err}", "error")
+                self.app_callback(
+                    BackupEventType.BACKUP_PLAYLIST_ERROR, {"playlist": playlist, "error": err})
+                continue
+            await write_queue.put(WriteJob(WriteJobType.PLAYLIST_FINISHED, key, playlist))
+
+    def _page_job(self,
+                  key: int,
+                  offset: int,
+                  body: bytes,
+                  base_hashes: Dict[int, tuple],
+                  stats: dict) -> WriteJob:
+        page_hash = hash_page(body)
+        base = base_hashes.get(offset)
+        if base is not None and base[0] == page_hash:
+            stats["pages_unchanged"] += 1
+            return WriteJob(WriteJobType.PLAYLIST_PAGE_UNCHANGED, key, offset=offset,
+                            page_hash=page_hash, base_range=base[1:])
+        stats["pages_parsed"] += 1
+        return WriteJob(WriteJobType.PLAYLIST_TRACKS, key, items=Tracks(**json.loads(body)).items,
+                        offset=offset, page_hash=page_hash)
+
+    async def _write_playlists(self, write_queue: asyncio.Queue, backup_id: int, stats: dict):
+        """the write stage of the backup. Takes every job waiting in the queue, up to WRITE_BATCH_SIZE,
+        and writes them in a single transaction
+        """
+        # WriteJob.key: the playlist being written
+        playlist_rows: Dict[int, PendingPlaylist] = {}
+        catalog = CatalogIds()
+        finished = False
+        while not finished:
+            jobs: List[WriteJob] = [await write_queue.get()]
+            while len(jobs) < WRITE_BATCH_SIZE and not write_queue.empty():
+                jobs.append(write_queue.get_nowait())
+            if jobs[-1] is None:
+                # the fetch stage has finished
+                finished = True
+                jobs.pop()
+            # a rolled back batch raises. The pending track_lists may hold ids that no
+            # longer exist so the backup can not carry on
+            await self.storage.transaction(
+                self._write_jobs, jobs, backup_id, playlist_rows, catalog)
+            for job in jobs:
+                if job.type in (WriteJobType.PLAYLIST_FINISHED, WriteJobType.PLAYLIST_UNCHANGED):
+                    stats["playlists"] += 1
+                    if job.type == WriteJobType.PLAYLIST_UNCHANGED:
+                        stats["unchanged"] += 1
+                    self.app_callback(
+                        BackupEventType.BACKUP_PLAYLIST_ADDED, {"playlist": job.playlist})
+
+    def _write_jobs(self,
+                    cursor: sqlite3.Cursor,
+                    jobs: List[WriteJob],
+                    backup_id: int,
+                    playlist_rows: Dict[int, PendingPlaylist],
+                    catalog: CatalogIds):
+        try:
+            for job in jobs:
+                self._write_job(cursor, job, backup_id, playlist_rows, catalog)
+        except Exception:
+            # the transaction gets rolled back so the cached ids may no longer exist
+            catalog.clear()
+            raise
+
+    def _write_job(self,
+                   cursor: sqlite3.Cursor,
+                   job: WriteJob,
+                   backup_id: int,
+                   playlist_rows: Dict[int, PendingPlaylist],
+                   catalog: CatalogIds):
+        if job.type == WriteJobType.PLAYLIST_STARTED:
+            playlist_rows[job.key] = PendingPlaylist(
+                self._insert_playlist(cursor, job.playlist, backup_id), job.base_id)
+        elif job.type == WriteJobType.PLAYLIST_TRACKS:
+            pending = playlist_rows[job.key]
+            track_ids = self._insert_tracks(cursor, job.items, catalog)
+            if job.page_hash is not None:
+                pending.page_hashes.append(
+                    (job.offset, job.page_hash, len(pending.track_list), len(track_ids)))
+            pending.track_list.extend(track_ids)
+        elif job.type == WriteJobType.PLAYLIST_PAGE_UNCHANGED:
+            pending = playlist_rows[job.key]
+            if pending.base_track_list is None:
+                pending.base_track_list = read_track_list(cursor, pending.base_id)
+            start, count = job.base_range
+            pending.page_hashes.append((job.offset, job.page_hash, len(pending.track_list), count))
+            pending.track_list.extend(pending.base_track_list[start:start + count])
+        elif job.type == WriteJobType.PLAYLIST_PAGE:
+            pending = playlist_rows[job.key]
+            self._insert_page(cursor, pending.row_id, job.offset, job.body)
+            pending.pages += 1
+        elif job.type == WriteJobType.PLAYLIST_FINISHED:
+            pending = playlist_rows.pop(job.key)
+            if not pending.pages:
+                self._store_track_list(cursor, pending.row_id, pending.track_list, pending.base_id)
+                self._index_playlist_tracks(
+                    cursor, job.playlist.id, backup_id, pending.row_id, pending.track_list)
+                self._store_page_hashes(cursor, pending.row_id, pending.page_hashes)
+            # only a fully stored playlist gets its snapshot_id so an interrupted
+            # backup is never used as the source of the next one
+            self._set_playlist_snapshot(cursor, pending.row_id, job.playlist.snapshot_id)
+        elif job.type == WriteJobType.PLAYLIST_UNCHANGED:
+            self._insert_playlist(cursor, job.playlist, backup_id, job.source_id)
+        elif job.type == WriteJobType.PLAYLIST_FAILED:
+            pending = playlist_rows.pop(job.key, None)
+            if pending is not None:
+                self._fail_playlist(cursor, pending.row_id, job.playlist.id, backup_id)
+
+    def _fail_playlist(self, cursor: sqlite3.Cursor, row_id: int, playlist_id: str, backup_id: int):
+        """drops the pages of a playlist that could not be fetched and points its row to the
+        last fully stored version. The stored snapshot_id is kept so the next backup fetches it again.
+        With no stored version the row is left incomplete, see StoredPlaylist.complete
+        """
+        cursor.execute("DELETE FROM Pages WHERE playlist_id = ?", (row_id,))
+        cursor.execute("DELETE FROM PageHashes WHERE playlist_id = ?", (row_id,))
+        cursor.execute('''
+        SELECT snapshot_id, COALESCE(source_id, id) FROM Playlists
+        WHERE playlist_id = ? AND backup_id != ? AND snapshot_id IS NOT NULL
+        ORDER BY id DESC LIMIT 1''', (playlist_id, backup_id))
+        stored = cursor.fetchone()
+        if stored is not None:
+            cursor.execute(
+                "UPDATE Playlists SET snapshot_id = ?, source_id = ? WHERE id = ?", (*stored, row_id))
+
+    def _discard_incomplete_playlists(self, cursor: sqlite3.Cursor, backup_id: int):
+        # playlists a failed backup started but never finished
+        cursor.execute('''
+        SELECT id FROM Playlists
+        WHERE backup_id = ? AND snapshot_id IS NULL AND source_id IS NULL''', (backup_id,))
+        self._delete_playlist_rows(cursor, [row[0] for row in cursor.fetchall()])
+
+    def _delete_playlist_rows(self, cursor: sqlite3.Cursor, playlist_rows: List[int]):
+        """removes Playlists rows that were never fully stored with their pages and page hashes
+        """
+        rows = [(row_id,) for row_id in playlist_rows]
+        cursor.executemany("DELETE FROM Pages WHERE playlist_id = ?", rows)
+        cursor.executemany("DELETE FROM PageHashes WHERE playlist_id = ?", rows)
+        cursor.executemany("DELETE FROM Playlists WHERE id = ?", rows)
+
+    async def import_backup(self, path: str) -> int:
+        """loads a backup archive made by backup_archive.export_backup as a new backup.
+        The archive is read IMPORT_BATCH_SIZE lines at a time on a worker thread while the
+        previous batch is written, so only two batches are ever in memory
+
+        every batch is committed on its own so a failed import removes the backup again
+
+        Args:
+            path (str): the .gz or .xz archive
+
+        Raises:
+            backup_archive.ArchiveError: if the archive can not be read or a batch failed to write
+
+        Returns:
+            int: the Backups primary key of the imported backup
+        """
+        # backup_archive imports this module
+        import backup_archive
+        loop = asyncio.get_running_loop()
+        records = backup_archive.iter_archive_records(path)
+        state = ImportState()
+        try:
+            batch = await loop.run_in_executor(
+                None, backup_archive.read_batch, records, IMPORT_BATCH_SIZE)
+            while batch:
+                reading = loop.run_in_executor(
+                    None, backup_archive.read_batch, records, IMPORT_BATCH_SIZE)
+                try:
+                    await self.storage.transaction(self._import_records, batch, state)
+                finally:
+                    # the records can not be closed while the next batch is being read
+                    await asyncio.wait([reading])
+                batch = await reading
+            await self.storage.transaction(self._finish_imported_playlist, state)
+        except Exception as err:
+            # the batches already committed leave a partial backup behind
+            if state.backup_id is not None:
+                try:
+                    await self.storage.transaction(self._delete_backup, state.backup_id)
+                except sqlite3.Error:
+                    pass
+            if isinstance(err, sqlite3.Error):
+                raise backup_archive.ArchiveError(f"Could not import {path}. {err}") from err
+            raise
+        finally:
+            records.close()
+        if state.backup_id is None:
+            raise backup_archive.ArchiveError(f"{path} has no backup header")
+        globals.logger.console(
+            f"Imported {state.playlists} playlists and {state.tracks} tracks from {path}")
+        return state.backup_id
+
+    def _import_records(self, cursor: sqlite3.Cursor, records: List[dict], state: ImportState):
+        # import here as backup_archive imports this module
+        from backup_archive import ARCHIVE_VERSION, ArchiveError
+        tracks: List[CatalogTrack] = []
+
+        def flush_tracks():
+            if tracks:
+                state.playlist.track_list.extend(
+                    self._insert_catalog_tracks(cursor, tracks, state.catalog))
+                state.tracks += len(tracks)
+                tracks.clear()
+
+        for record in records:
+            record_type = record.get("type")
+            if record_type == "track":
+                if state.playlist is None:
+                    raise ArchiveError("Track found before any playlist")
+                album = record.get("album") or {"id": None, "name": ""}
+                tracks.append(CatalogTrack(
+                    record["uri"], record.get("name", ""),
+                    catalog_key(album["id"], album["name"]), album["name"],
+                    [(catalog_key(artist["id"], artist["name"]), artist["name"])
+                     for artist in record.get("artists", [])]))
+            elif record_type == "playlist":
+                if state.backup_id is None:
+                    raise ArchiveError("Playlist found before the backup header")
+                flush_tracks()
+                self._finish_imported_playlist(cursor, state)
+                row_id = self._insert_playlist_row(
+                    cursor, record["playlist_id"], record["uri"], record.get("name"),
+                    record.get("description"), record.get("total_songs"), state.backup_id)
+                state.playlist = PendingPlaylist(
+                    row_id, playlist_id=record["playlist_id"], snapshot_id=record.get("snapshot_id"))
+                state.playlists += 1
+            elif record_type == "backup":
+                if state.backup_id is not None:
+                    raise ArchiveError("Archive has more than one backup")
+                if record.get("version", 0) > ARCHIVE_VERSION:
+                    raise ArchiveError(f"Archive version {record.get('version')} is newer than this app")
+                state.backup_id = self._add_backup(
+                    cursor, record.get("name"), record.get("description"), record.get("date_added"))
+        flush_tracks()
+
+    def _finish_imported_playlist(self, cursor: sqlite3.Cursor, state: ImportState):
+        pending = state.playlist
+        if pending is None:
+            return
+        self._store_track_list(cursor, pending.row_id, pending.track_list)
+        self._index_playlist_tracks(
+            cursor, pending.playlist_id, state.backup_id, pending.row_id, pending.track_list)
+        if pending.snapshot_id:
+            self._set_playlist_snapshot(cursor, pending.row_id, pending.snapshot_id)
+        state.playlist = None
+
+    def _delete_backup(self, cursor: sqlite3.Cursor, backup_id: int):
+        # the track search entries first added by this backup go with it
+        cursor.execute("DELETE FROM TrackPlaylists WHERE first_backup_id = ?", (backup_id,))
+        cursor.execute("SELECT id FROM Playlists WHERE backup_id = ?", (backup_id,))
+        self._delete_playlist_rows(cursor, [row[0] for row in cursor.fetchall()])
+        cursor.execute("DELETE FROM Backups WHERE id = ?", (backup_id,))
+
+    async def restore_backup(self,
+                             callback: BACKUP_CALLBACK_TYPE,
+                             token: str,
+                             backup_id: int,
+                             playlist_ids: List[str] = None):
+        """recreates the playlists of a stored backup in the users library. MAX_PLAYLISTS_RESTORE
+        playlists are written at the same time and their tracks are added MAX_TRACKS_PER_WRITE at a time.
+
+        a playlist the user can still edit is restored in place. Only the tracks missing from it
+        are added and the tracks not in the backup are removed, so the added_at dates of every
+        other track are kept. Then the tracks out of the backup order are moved back with
+        plan_track_moves. Deleted playlists are created again.
+
+        every created playlist and every added chunk is recorded in the RestorePlaylists journal.
+        Restoring the same backup again after an error or the app closing carries on where it
+        stopped. A chunk that was sent but not recorded before the app closed is sent again
+
+        Args:
+            callback (BACKUP_CALLBACK_TYPE): the callback to send the RESTORE events to
+            token (str): the authenticating spotify token
+            backup_id (int): the Backups primary key
+            playlist_ids (List[str], optional): only restore these Spotify playlist IDs. Defaults to None.
+        """
+        self.app_callback = callback
+        try:
+            playlists = [playlist for playlist in await self.get_backup_playlists(backup_id)
+                         if playlist_ids is None or playlist.playlist_id in playlist_ids]
+            restore_id, progress = await self.storage.transaction(
+                self._start_restore, backup_id, [playlist.id for playlist in playlists])
+        except sqlite3.Error as err:
+            callback(BackupEventType.RESTORE_ERROR, {"error": err})
+            return
+        try:
+            live_playlists = {item.id: item async for item in self._playlists(token, 50)
+                              if item.collaborative or (item.owner is not None and item.owner.id == self.user.id)}
+        except (spotify.net.SpotifyError, aiohttp.ClientError, asyncio.TimeoutError) as err:
+            callback(BackupEventType.RESTORE_ERROR, {"error": err})
+            return
+        stats = {"playlists": 0, "resumed": 0, "tracks": 0, "requests": 0, "local_skipped": 0, "errors": 0,
+                 "requests_saved": 0, "tracks_moved": 0, "order_skipped": 0}
+        playlist_queue: asyncio.Queue = asyncio.Queue()
+        for playlist in playlists:
+            playlist_queue.put_nowait(playlist)
+        workers = [
+            asyncio.create_task(self._restore_worker(
+                token, restore_id, playlist_queue, progress, live_playlists, stats))
+            for _ in range(MAX_PLAYLISTS_RESTORE)]
+        try:
+            await asyncio.gather(*workers)
+            if not stats["errors"]:
+                await self.storage.transaction(self._finish_restore, restore_id)
+            globals.logger.console(
+                f"Restore complete. {stats['playlists']} of {len(playlists)} playlists restored with "
+                f"{stats['tracks']} tracks in {stats['requests']} requests. {stats['requests_saved']} "
+                f"requests saved by only writing the changes to existing playlists. "
+                f"{stats['tracks_moved']} tracks moved back into order. "
+                f"{stats['local_skipped']} local files can not be restored")
+            callback(BackupEventType.RESTORE_SUCCESS, stats)
+        except Exception as err:
+            globals.logger.console(err.__str__(), "error")
+            callback(BackupEventType.RESTORE_ERROR, {"error": err})
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def _restore_worker(self,
+                              token: str,
+                              restore_id: int,
+                              playlist_queue: asyncio.Queue,
+                              progress: Dict[int, RestoreProgress],
+                              live_playlists: Dict[str, PlaylistItem],
+                              stats: dict):
+        while True:
+            try:
+                playlist: StoredPlaylist = playlist_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if not playlist.complete:
+                # the tracks were never stored. Restoring it would empty the live playlist
+                stats["errors"] += 1
+                globals.logger.console(
+                    f"Playlist {playlist.name} was not fully backed up and can not be restored", "error")
+                self.app_callback(
+                    BackupEventType.RESTORE_PLAYLIST_ERROR,
+                    {"playlist": playlist, "error": "the playlist was not fully backed up"})
+                continue
+            try:
+                await self._restore_playlist(
+                    token, restore_id, playlist, progress[playlist.id], live_playlists.get(playlist.playlist_id), stats)
+            except (spotify.net.SpotifyError, aiohttp.ClientError, asyncio.TimeoutError) as err:
+                # the journal keeps what was written so the next restore carries on from there
+                stats["errors"] += 1
+                globals.logger.console(
+                    f"Error restoring playlist {playlist.name}. {err}", "error")
+                self.app_callback(
+                    BackupEventType.RESTORE_PLAYLIST_ERROR, {"playlist": playlist, "error": err})
+                continue
+            stats["playlists"] += 1
+            self.app_callback(BackupEventType.RESTORE_PLAYLIST_ADDED, {"playlist": playlist})
+
+    async def _restore_playlist(self,
+                                token: str,
+                                restore_id: int,
+                                playlist: StoredPlaylist,
+                                entry: RestoreProgress,
+                                live: PlaylistItem,
+                                stats: dict):
+        if entry.finished:
+            stats["resumed"] += 1
+            return
+        uris = []
+        async for track in self.iter_playlist_tracks(playlist):
+            if track.uri.startswith(LOCAL_TRACK_PREFIX):
+                stats["local_skipped"] += 1
+            else:
+                uris.append(track.uri)
+        if live is not None and entry.target_id in (None, live.id):
+            entry.target_id = live.id
+            await self._restore_changes(token, playlist, live, uris, stats)
+        else:
+            await self._restore_new_playlist(token, restore_id, playlist, entry, uris, stats)
+        entry.finished = True
+        await self.storage.transaction(self._update_restore, restore_id, entry)
+
+    async def _restore_changes(self,
+                               token: str,
+                               playlist: StoredPlaylist,
+                               live: PlaylistItem,
+                               uris: List[str],
+                               stats: dict):
+        """writes the difference between the live playlist and the backup. Working it out again
+        on a resumed restore gives whatever is left to do so nothing is journalled until it is finished
+        """
+        chunk_size = spotify.net.MAX_TRACKS_PER_WRITE
+        # removing every track then adding the backup back
+        rewrite_requests = -(-live.tracks.total // chunk_size) + -(-len(uris) // chunk_size)
+        if live.snapshot_id == playlist.snapshot_id:
+            stats["requests_saved"] += rewrite_requests
+            return
+        live_uris = []
+        # local files and unavailable tracks take up positions that cant be written to
+        unmovable = False
+        async for tracks in spotify.net.iter_playlist_track_pages(
+                token, live.id, fields=spotify.constants.FIELDS_TRACKS_RESTORE, total=live.tracks.total):
+            for item in tracks.items:
+                if item.track is None or item.track.uri.startswith(LOCAL_TRACK_PREFIX):
+                    unmovable = True
+                else:
+                    live_uris.append(item.track.uri)
+        removes, adds = diff_track_uris(live_uris, uris)
+        requests = 0
+        # every write is made against the version the previous one returned
+        snapshot_id = live.snapshot_id
+        for start in range(0, len(removes), chunk_size):
+            snapshot_id = await spotify.net.remove_tracks_from_playlist(
+                token, live.id, removes[start:start + chunk_size], snapshot_id)
+            requests += 1
+        for start in range(0, len(adds), chunk_size):
+            snapshot_id = await spotify.net.add_tracks_to_playlist(token, live.id, adds[start:start + chunk_size])
+            requests += 1
+        if unmovable:
+            stats["order_skipped"] += 1
+            globals.logger.console(
+                f"{playlist.name} has local or unavailable tracks. Its order was not restored", "warning")
+        else:
+            # the adds went on the end after the tracks that were kept
+            removed = set(removes)
+            current = [uri for uri in live_uris if uri not in removed] + adds
+            # planning a large shuffled playlist takes seconds so it is kept off the event loop
+            moves = await asyncio.get_running_loop().run_in_executor(None, plan_track_moves, current, uris)
+            for range_start, insert_before, range_length in moves:
+                snapshot_id = await spotify.net.reorder_playlist_tracks(
+                    token, live.id, range_start, insert_before, range_length, snapshot_id)
+                requests += 1
+                stats["tracks_moved"] += range_length
+        stats["requests"] += requests
+        stats["tracks"] += len(adds)
+        stats["requests_saved"] += max(rewrite_requests - requests, 0)
+
+    async def _restore_new_playlist(self,
+                                    token: str,
+                                    restore_id: int,
+                                    playlist: StoredPlaylist,
+                                    entry: RestoreProgress,
+                                    uris: List[str],
+                                    stats: dict):
+        if entry.target_id is None:
+            created = await spotify.net.create_playlist(
+                token, self.user.id, playlist.name, playlist.description)
+            stats["requests"] += 1
+            entry.target_id = created.id
+            # recorded straight away so a resumed restore doesnt create it again
+            await self.storage.transaction(self._update_restore, restore_id, entry)
+        elif entry.tracks_added:
+            stats["resumed"] += 1
+        for start in range(entry.tracks_added, len(uris), spotify.net.MAX_TRACKS_PER_WRITE):
+            chunk = uris[start:start + spotify.net.MAX_TRACKS_PER_WRITE]
+            await spotify.net.add_tracks_to_playlist(token, entry.target_id, chunk)
+            stats["requests"] += 1
+            stats["tracks"] += len(chunk)
+            entry.tracks_added = start + len(chunk)
+            await self.storage.transaction(self._update_restore, restore_id, entry)
+
+    def _start_restore(self,
+                       cursor: sqlite3.Cursor,
+                       backup_id: int,
+                       playlist_rows: List[int]) -> tuple:
+        """carries on the newest unfinished restore of the backup or starts a new one
+
+        Returns:
+            tuple: Restores id, {Playlists id: RestoreProgress}
+        """
+        cursor.execute('''
+        SELECT id FROM Restores WHERE backup_id = ? AND date_finished IS NULL
+        ORDER BY id DESC LIMIT 1''', (backup_id,))
+        row = cursor.fetchone()
+        if row is not None:
+            restore_id = row[0]
+        else:
+            cursor.execute(
+                "INSERT INTO Restores (backup_id, date_started) VALUES (?, ?)", (backup_id, datetime.now()))
+            restore_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT OR IGNORE INTO RestorePlaylists (restore_id, playlist_id) VALUES (?, ?)",
+            [(restore_id, playlist_row) for playlist_row in playlist_rows])
+        cursor.execute('''
+        SELECT playlist_id, target_id, tracks_added, finished FROM RestorePlaylists
+        WHERE restore_id = ?''', (restore_id,))
+        return restore_id, {row[0]: RestoreProgress(row[0], row[1], row[2], bool(row[3]))
+                            for row in cursor.fetchall()}
+
+    def _update_restore(self, cursor: sqlite3.Cursor, restore_id: int, entry: RestoreProgress):
+        cursor.execute('''
+        UPDATE RestorePlaylists SET target_id = ?, tracks_added = ?, finished = ?
+        WHERE restore_id = ? AND playlist_id = ?''',
+                       (entry.target_id, entry.tracks_added, int(entry.finished), restore_id, entry.playlist_id))
+
+    def _finish_restore(self, cursor: sqlite3.Cursor, restore_id: int):
+        # a restore of some of the playlists can share the journal with a restore of all of them
+        cursor.execute('''
+        UPDATE Restores SET date_finished = ? WHERE id = ? AND NOT EXISTS (
+            SELECT 1 FROM RestorePlaylists WHERE restore_id = ? AND finished = 0)''',
+                       (datetime.now(), restore_id, restore_id))
 
     async def add_backup(self, name: str, description: str) -> int:
         """adds a backup entry to the database file
@@ -283,58 +1565,521 @@ class PlaylistManager:
         Returns:
             int: the Backup Primary Key ID
         """
-        date_added = datetime.now()
-        with BackupSQlite(self.db_path) as cursor:
-            cursor.execute('''
-            INSERT INTO Backups (name, description, date_added)
-            VALUES(?, ?, ?)''', (name, description, date_added))
-            # cursor.execute(
-            #     "SELECT id from Backups WHERE date_added = ?", (date_added,))
-            # result: any = cursor.fetchone()[0]
-            id: int = cursor.lastrowid
-            return id
-
-    async def insert_playlist_db(self, item: PlaylistItem, backup_id: int) -> int:
+        return await self.storage.transaction(self._add_backup, name, description)
+
+    def _add_backup(self,
+                    cursor: sqlite3.Cursor,
+                    name: str,
+                    description: str,
+                    date_added: Union[datetime, str] = None) -> int:
+        if date_added is None:
+            date_added = datetime.now()
+        cursor.execute('''
+        INSERT INTO Backups (name, description, date_added)
+        VALUES(?, ?, ?)''', (name, description, date_added))
+        # cursor.execute(
+        #     "SELECT id from Backups WHERE date_added = ?", (date_added,))
+        # result: any = cursor.fetchone()[0]
+        id: int = cursor.lastrowid
+        return id
+
+    async def insert_playlist_db(self,
+                                 item: PlaylistItem,
+                                 backup_id: int,
+                                 source_id: int = None) -> int:
         """insert the playlist into the database file
 
         Args:
             playlist (Playlist): the playlist object to add
             backup_id (int): the primary key of the backup to associate to
+            source_id (int, optional): the Playlists row that holds the tracks of an unchanged playlist.
+                The snapshot_id is stored straight away when set. Defaults to None.
 
         Returns:
             int: the ID of the playlist
         """
-        with BackupSQlite(self.db_path) as cursor:
-            cursor.execute('''
-            INSERT INTO Playlists 
-            (playlist_id, uri, name, description, total_songs, backup_id) VALUES 
-            (?, ?, ?, ?, ?, ?)''',
-                           (item.id, item.uri, item.name, item.description, item.tracks.total, backup_id))
-            playlist_id = cursor.lastrowid
-            return playlist_id
+        return await self.storage.transaction(self._insert_playlist, item, backup_id, source_id)
+
+    def _insert_playlist(self,
+                         cursor: sqlite3.Cursor,
+                         item: PlaylistItem,
+                         backup_id: int,
+                         source_id: int = None) -> int:
+        snapshot_id = item.snapshot_id if source_id is not None else None
+        return self._insert_playlist_row(cursor, item.id, item.uri, item.name, item.description,
+                                         item.tracks.total, backup_id, snapshot_id, source_id)
+
+    def _insert_playlist_row(self,
+                             cursor: sqlite3.Cursor,
+                             playlist_id: str,
+                             uri: str,
+                             name: str,
+                             description: str,
+                             total_songs: int,
+                             backup_id: int,
+                             snapshot_id: str = None,
+                             source_id: int = None) -> int:
+        cursor.execute('''
+        INSERT INTO Playlists 
+        (playlist_id, uri, name, description, total_songs, backup_id, snapshot_id, source_id) VALUES 
+        (?, ?, ?, ?, ?, ?, ?, ?)''',
+                       (playlist_id, uri, name, description, total_songs,
+                        backup_id, snapshot_id, source_id))
+        return cursor.lastrowid
+
+    async def set_playlist_snapshot_db(self, playlist_id: int, snapshot_id: str):
+        """stores the snapshot_id once all of the playlists tracks have been stored
+
+        Args:
+            playlist_id (int): the primary key of the Playlists row
+            snapshot_id (str): the snapshot_id from Spotify
+        """
+        await self.storage.transaction(self._set_playlist_snapshot, playlist_id, snapshot_id)
+
+    def _set_playlist_snapshot(self, cursor: sqlite3.Cursor, playlist_id: int, snapshot_id: str):
+        cursor.execute(
+            "UPDATE Playlists SET snapshot_id = ? WHERE id = ?", (snapshot_id, playlist_id))
+
+    def _set_playlist_track_list(self, cursor: sqlite3.Cursor, playlist_id: int, track_ids: List[int]):
+        cursor.execute(
+            "UPDATE Playlists SET track_list = ? WHERE id = ?", (pack_track_list(track_ids), playlist_id))
+
+    def _store_track_list(self,
+                          cursor: sqlite3.Cursor,
+                          playlist_id: int,
+                          track_ids: List[int],
+                          base_id: int = None):
+        """stores the tracks as a delta against base_id or as a full checkpoint if there is
+        no base, the chain is CHECKPOINT_INTERVAL long or the delta would be bigger
+        """
+        if base_id is not None:
+            cursor.execute("SELECT COALESCE(delta_depth, 0) FROM Playlists WHERE id = ?", (base_id,))
+            row = cursor.fetchone()
+            if row is not None and row[0] + 1 < CHECKPOINT_INTERVAL:
+                delta = encode_track_delta(self._get_track_list(cursor, base_id), track_ids)
+                if len(delta) < len(track_ids):
+                    cursor.execute('''
+                    UPDATE Playlists SET track_list = NULL, base_id = ?, delta = ?, delta_depth = ?
+                    WHERE id = ?''', (base_id, pack_track_list(delta), row[0] + 1, playlist_id))
+                    return
+        self._set_playlist_track_list(cursor, playlist_id, track_ids)
+
+    def _insert_page(self, cursor: sqlite3.Cursor, playlist_id: int, offset: int, body: bytes):
+        cursor.execute(
+            "INSERT INTO Pages (playlist_id, offset, compression, body) VALUES (?, ?, ?, ?)",
+            (playlist_id, offset, PAGE_COMPRESSION, compress_page(body)))
+
+    def _store_page_hashes(self, cursor: sqlite3.Cursor, playlist_id: int, page_hashes: List[tuple]):
+        cursor.executemany('''
+        INSERT INTO PageHashes (playlist_id, offset, hash, first_index, count)
+        VALUES (?, ?, ?, ?, ?)''', [(playlist_id, *page) for page in page_hashes])
+
+    async def get_page_hashes(self, playlist_id: int) -> Dict[int, tuple]:
+        """gets the hashes of the pages a playlist was backed up from
+
+        Args:
+            playlist_id (int): the Playlists row holding the tracks
+
+        Returns:
+            Dict[int, tuple]: page offset: (hash, first index in the track_list, count)
+        """
+        return await self.storage.transaction(self._get_page_hashes, playlist_id)
+
+    def _get_page_hashes(self, cursor: sqlite3.Cursor, playlist_id: int) -> Dict[int, tuple]:
+        cursor.execute(
+            "SELECT offset, hash, first_index, count FROM PageHashes WHERE playlist_id = ?", (playlist_id,))
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+
+    def _index_playlist_tracks(self,
+                               cursor: sqlite3.Cursor,
+                               playlist_id: str,
+                               backup_id: int,
+                               row_id: int,
+                               track_ids: List[int]):
+        """records which tracks have been in the playlist. The first backup is kept and the
+        newest Playlists row holding the track is updated. Unchanged playlists point to that
+        row with their source_id so they never need to write here
+        """
+        cursor.executemany('''
+        INSERT INTO TrackPlaylists (track_id, playlist_id, first_backup_id, last_row_id) VALUES (?, ?, ?, ?)
+        ON CONFLICT(track_id, playlist_id) DO UPDATE SET last_row_id = excluded.last_row_id''',
+                           [(track_id, playlist_id, backup_id, row_id) for track_id in set(track_ids)])
+
+    async def search_tracks(self, text: str, limit: int = MAX_SEARCH_RESULTS) -> List[SearchResult]:
+        """full text search of every backed up track name, artist and album. Best match first
+
+        Args:
+            text (str): what the user typed. The last word is matched as a prefix
+            limit (int, optional): the most results. Defaults to MAX_SEARCH_RESULTS.
+
+        Returns:
+            List[SearchResult]: empty if nothing matched or search is not available
+        """
+        query = build_search_query(text)
+        if not query or not self.search_enabled:
+            return []
+        return await self.storage.transaction(self._search_tracks, query, limit)
+
+    def _search_tracks(self, cursor: sqlite3.Cursor, query: str, limit: int) -> List[SearchResult]:
+        # a name match counts for more than an artist match which counts for more than the album
+        cursor.execute('''
+        SELECT rowid FROM TrackSearch WHERE TrackSearch MATCH ?
+        ORDER BY bm25(TrackSearch, 10.0, 5.0, 2.0) LIMIT ?''', (query, limit))
+        track_ids = [row[0] for row in cursor.fetchall()]
+        if not track_ids:
+            return []
+        results = {track.id: SearchResult(track)
+                   for track in self._get_catalog_tracks(cursor, track_ids)}
+        # the newest backup is the last one storing or pointing to the newest version with the track
+        cursor.execute(f'''
+        SELECT TrackPlaylists.track_id, TrackPlaylists.playlist_id,
+        (SELECT name FROM Playlists WHERE Playlists.playlist_id = TrackPlaylists.playlist_id
+         ORDER BY id DESC LIMIT 1),
+        TrackPlaylists.first_backup_id,
+        (SELECT MAX(backup_id) FROM Playlists
+         WHERE id = TrackPlaylists.last_row_id OR source_id = TrackPlaylists.last_row_id)
+        FROM TrackPlaylists WHERE TrackPlaylists.track_id IN ({",".join("?" * len(track_ids))})
+        ORDER BY TrackPlaylists.first_backup_id''', track_ids)
+        rows = cursor.fetchall()
+        backup_ids = list({backup_id for row in rows for backup_id in row[3:] if backup_id is not None})
+        backups = {}
+        for start in range(0, len(backup_ids), 500):
+            chunk = backup_ids[start:start + 500]
+            cursor.execute(f'''
+            SELECT id, name, description, date_added FROM Backups
+            WHERE id IN ({",".join("?" * len(chunk))})''', chunk)
+            backups.update((row[0], StoredBackup(*row)) for row in cursor.fetchall())
+        for track_id, playlist_id, name, first_id, last_id in rows:
+            first = backups.get(first_id)
+            results[track_id].playlists[playlist_id] = SearchPlaylist(
+                name, first, backups.get(last_id, first))
+        return [results[track_id] for track_id in track_ids if track_id in results]
+
+    async def reconstruct_track_list(self, playlist_id: int) -> array:
+        """rebuilds the track_list of any stored version by replaying the deltas
+        from its nearest checkpoint
+
+        Args:
+            playlist_id (int): the Playlists row holding the tracks. StoredPlaylist.tracks_id
+
+        Returns:
+            array: the ordered Tracks ids
+        """
+        return await self.storage.transaction(self._get_track_list, playlist_id)
+
+    def _get_track_list(self, cursor: sqlite3.Cursor, playlist_id: int) -> array:
+        return read_track_list(cursor, playlist_id)
+
+    async def get_latest_playlist_versions(self, raw: bool = False) -> Dict[str, tuple]:
+        """gets the newest fully stored version of every playlist in the database
+
+        Args:
+            raw (bool, optional): only look at versions stored as raw pages. Defaults to False.
+
+        Returns:
+            Dict[str, tuple]: Spotify playlist ID: (snapshot_id, id of the Playlists row holding the tracks)
+        """
+        return await self.storage.transaction(self._get_latest_playlist_versions, raw)
+
+    def _get_latest_playlist_versions(self, cursor: sqlite3.Cursor, raw: bool) -> Dict[str, tuple]:
+        # a raw version can only be reused by a raw backup and the same for catalogued versions
+        cursor.execute('''
+        SELECT playlist_id, snapshot_id, COALESCE(source_id, id) FROM Playlists
+        WHERE id IN (
+            SELECT MAX(id) FROM Playlists
+            WHERE snapshot_id IS NOT NULL
+            AND EXISTS (SELECT 1 FROM Pages WHERE Pages.playlist_id = COALESCE(source_id, Playlists.id)) = ?
+            GROUP BY playlist_id)''', (int(raw),))
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    async def list_backups(self, limit: int = 50, before_id: int = None) -> List[StoredBackup]:
+        """gets the backups newest first
+
+        Args:
+            limit (int, optional): the most backups to return. Defaults to 50.
+            before_id (int, optional): id of the last backup of the previous page. Defaults to None.
+
+        Returns:
+            List[StoredBackup]: empty list if there are no more backups
+        """
+        return await self.storage.transaction(self._list_backups, limit, before_id)
+
+    def _list_backups(self, cursor: sqlite3.Cursor, limit: int, before_id: int) -> List[StoredBackup]:
+        if before_id is None:
+            before_id = sys.maxsize
+        cursor.execute('''
+        SELECT id, name, description, date_added FROM Backups
+        WHERE id < ? ORDER BY id DESC LIMIT ?''', (before_id, limit))
+        return [StoredBackup(*row) for row in cursor.fetchall()]
+
+    async def get_backup_playlists(self, backup_id: int) -> List[StoredPlaylist]:
+        """gets the playlists stored in a backup
+
+        Args:
+            backup_id (int): the Backups primary key
+
+        Returns:
+            List[StoredPlaylist]: in the order they were backed up
+        """
+        return await self.storage.transaction(self._get_backup_playlists, backup_id)
+
+    def _get_backup_playlists(self, cursor: sqlite3.Cursor, backup_id: int) -> List[StoredPlaylist]:
+        cursor.execute('''
+        SELECT id, playlist_id, uri, name, description, total_songs, backup_id, snapshot_id,
+        COALESCE(source_id, id),
+        EXISTS (SELECT 1 FROM Pages WHERE Pages.playlist_id = COALESCE(source_id, Playlists.id)),
+        NOT (snapshot_id IS NULL AND source_id IS NULL AND track_list IS NULL AND delta IS NULL)
+        FROM Playlists WHERE backup_id = ? ORDER BY id''', (backup_id,))
+        return [StoredPlaylist(*row) for row in cursor.fetchall()]
+
+    async def iter_playlist_tracks(self,
+                                   playlist: StoredPlaylist,
+                                   page_size: int = READ_PAGE_SIZE) -> AsyncGeneratorType:
+        """streams the tracks of a stored playlist in the order they were backed up.
+        The packed track_list is read once then the catalog is read page_size tracks at a time
+
+        Args:
+            playlist (StoredPlaylist): from get_backup_playlists
+            page_size (int, optional): tracks read per query. Defaults to READ_PAGE_SIZE.
+
+        Yields:
+            StoredTrack
+        """
+        if playlist.raw:
+            async for tracks in self.iter_raw_pages(playlist):
+                for item in tracks.items:
+                    if item.track is None:
+                        continue
+                    # not in the catalog so there is no Tracks id
+                    yield StoredTrack(None, item.track.uri, item.track.name, item.track_album.name,
+                                      [artist.name for artist in item.track.artists])
+            return
+        track_list = await self.reconstruct_track_list(playlist.tracks_id)
+        if not track_list:
+            return
+        for start in range(0, len(track_list), page_size):
+            tracks = await self.storage.transaction(
+                self._get_catalog_tracks, track_list[start:start + page_size])
+            for track in tracks:
+                yield track
+
+    async def iter_raw_pages(self, playlist: StoredPlaylist) -> AsyncGeneratorType:
+        """parses the pages of a raw backup one at a time. Nothing is validated until here
+
+        Args:
+            playlist (StoredPlaylist): from get_backup_playlists with raw set
+
+        Yields:
+            Tracks: every page in order
+        """
+        pages_per_read = max(1, READ_PAGE_SIZE // spotify.net.MAX_TRACKS_PAGE_LIMIT)
+        offset = -1
+        while True:
+            pages = await self.storage.transaction(
+                self._get_pages, playlist.tracks_id, offset, pages_per_read)
+            if not pages:
+                return
+            for offset, body in pages:
+                yield Tracks(**json.loads(body))
+
+    def _get_pages(self, cursor: sqlite3.Cursor, playlist_id: int, after_offset: int, limit: int) -> List[tuple]:
+        """
+        Returns:
+            List[tuple]: (offset, decompressed body) of the next pages after after_offset
+        """
+        cursor.execute('''
+        SELECT offset, compression, body FROM Pages
+        WHERE playlist_id = ? AND offset > ? ORDER BY offset LIMIT ?''', (playlist_id, after_offset, limit))
+        return [(offset, decompress_page(compression, body)) for offset, compression, body in cursor.fetchall()]
+
+    def _get_catalog_tracks(self, cursor: sqlite3.Cursor, track_ids: List[int]) -> List[StoredTrack]:
+        """looks up the tracks by their Tracks id. SQLITE_MAX_VARIABLE_NUMBER limits track_ids to 999
+
+        Returns:
+            List[StoredTrack]: in the same order as track_ids. Duplicates are returned as the same object
+        """
+        unique_ids = list(set(track_ids))
+        placeholders = ",".join("?" * len(unique_ids))
+        cursor.execute(f'''
+        SELECT Tracks.id, Tracks.uri, Tracks.name, COALESCE(Albums.name, '') FROM Tracks
+        LEFT JOIN Albums ON Albums.id = Tracks.album_id
+        WHERE Tracks.id IN ({placeholders})''', unique_ids)
+        by_id = {row[0]: StoredTrack(*row, artists=[]) for row in cursor.fetchall()}
+        cursor.execute(f'''
+        SELECT TrackArtists.track_id, Artists.name FROM TrackArtists
+        JOIN Artists ON Artists.id = TrackArtists.artist_id
+        WHERE TrackArtists.track_id IN ({placeholders})
+        ORDER BY TrackArtists.track_id, TrackArtists.position''', unique_ids)
+        for track_id, name in cursor.fetchall():
+            by_id[track_id].artists.append(name)
+        return [by_id[track_id] for track_id in track_ids if track_id in by_id]
+
+    async def iter_backup_diff(self, old_backup_id: int, new_backup_id: int) -> AsyncGeneratorType:
+        """streams what changed between two backups one playlist at a time.
+        Playlists sharing the same stored tracks are skipped without reading their track lists.
+        Raw playlists have no track_list to compare so they are skipped as well, the same
+        for playlists whose tracks were never stored as nothing is known about them
+
+        Args:
+            old_backup_id (int): the Backups primary key to compare from
+            new_backup_id (int): the Backups primary key to compare to
+
+        Yields:
+            PlaylistDiff: for every added, deleted or changed playlist
+        """
+        old_playlists = {playlist.playlist_id: playlist
+                         for playlist in await self.get_backup_playlists(old_backup_id)}
+        new_playlists = await self.get_backup_playlists(new_backup_id)
+        for playlist in new_playlists:
+            old = old_playlists.pop(playlist.playlist_id, None)
+            if old is None:
+                yield PlaylistDiff(DiffType.PLAYLIST_ADDED, playlist)
+                continue
+            if (old.tracks_id == playlist.tracks_id or old.raw or playlist.raw
+                    or not old.complete or not playlist.complete):
+                continue
+            changes = await self.storage.transaction(
+                self._diff_playlists, old.tracks_id, playlist.tracks_id)
+            if any(changes):
+                added, removed, moved = changes
+                yield PlaylistDiff(DiffType.PLAYLIST_CHANGED, playlist, added, removed, moved)
+        for old in old_playlists.values():
+            yield PlaylistDiff(DiffType.PLAYLIST_DELETED, old)
+
+    def _diff_playlists(self, cursor: sqlite3.Cursor, old_id: int, new_id: int) -> tuple:
+        old = self._get_track_list(cursor, old_id)
+        new = self._get_track_list(cursor, new_id)
+        if old == new:
+            return [], [], []
+        changes = []
+        for track_ids in diff_track_lists(old, new):
+            tracks = []
+            for start in range(0, len(track_ids), READ_PAGE_SIZE):
+                tracks.extend(self._get_catalog_tracks(cursor, track_ids[start:start + READ_PAGE_SIZE]))
+            changes.append(tracks)
+        return tuple(changes)
 
     async def insert_track_db(self, item: TrackItem, playlist_id: int) -> int:
-        with BackupSQlite(self.db_path) as cursor:
-            # ADD THE ALBUM FIRST
-            cursor.execute('''
-            INSERT INTO Albums (name) VALUES (?)''', (item.track.album.name,))
-            album_id = cursor.lastrowid
-            artist_names = list(
-                map(lambda artist: artist.name, item.track.artists))
-            artist_names = ",".join(artist_names)
-            # JOIN THE ARTISTS TOGETHER AND ADD THEM
-            cursor.execute('''
-            INSERT INTO Artists (name) VALUES (?)''', (artist_names,))
-            artists_id = cursor.lastrowid
-            # NOW ADD THE TRACK INFORMATION
-            cursor.execute('''
-            INSERT INTO Tracks 
-            (uri, name, playlist_id, artists_id, album_id) VALUES 
-            (?, ?, ?, ?, ?)''', (item.track.uri, item.track.name, playlist_id, artists_id, album_id))
-            track_id = cursor.lastrowid
-            globals.logger.console(
-                f"Track: {item.track.name} has been stored")
-            return track_id
+        track_id = await self.storage.transaction(self._insert_track, item, playlist_id)
+        globals.logger.console(
+            f"Track: {item.track_name} has been stored")
+        return track_id
+
+    def _insert_track(self, cursor: sqlite3.Cursor, item: TrackItem, playlist_id: int) -> int:
+        track_ids = self._insert_tracks(cursor, [item], CatalogIds())
+        if not track_ids:
+            return None
+        # add it to the end of the playlists track_list
+        cursor.execute('''
+        UPDATE Playlists SET track_list = COALESCE(track_list, X'') || ? WHERE id = ?''',
+                       (pack_track_list(track_ids), playlist_id))
+        cursor.execute("SELECT playlist_id, backup_id FROM Playlists WHERE id = ?", (playlist_id,))
+        row = cursor.fetchone()
+        if row is not None:
+            self._index_playlist_tracks(cursor, row[0], row[1], playlist_id, track_ids)
+        return track_ids[0]
+
+    @staticmethod
+    def _next_id(cursor: sqlite3.Cursor, table: str) -> int:
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    def _upsert_catalog(cursor: sqlite3.Cursor, table: str, rows: Dict[str, str], ids: Dict[str, int]):
+        """adds the missing albums or artists and fills in their row ids
+
+        Args:
+            table (str): Albums or Artists
+            rows (Dict[str, str]): catalog_key to name
+            ids (Dict[str, int]): catalog_key to row id. Updated in place
+        """
+        missing = [(key, name) for key, name in rows.items() if key not in ids]
+        if not missing:
+            return
+        cursor.executemany(f'''
+        INSERT INTO {table} (spotify_id, name) VALUES (?, ?)
+        ON CONFLICT(spotify_id) DO NOTHING''', missing)
+        # SQLITE_MAX_VARIABLE_NUMBER is 999 on older builds
+        for start in range(0, len(missing), 500):
+            keys = [key for key, _ in missing[start:start + 500]]
+            cursor.execute(
+                f"SELECT spotify_id, id FROM {table} WHERE spotify_id IN ({','.join('?' * len(keys))})",
+                keys)
+            ids.update(cursor.fetchall())
+
+    def _insert_tracks(self,
+                       cursor: sqlite3.Cursor,
+                       items: List[TrackItem],
+                       catalog: CatalogIds) -> List[int]:
+        """adds a page of tracks from the Spotify API to the catalog
+
+        Returns:
+            List[int]: the Tracks ids in the same order as items. Unavailable tracks are left out
+        """
+        tracks = []
+        for item in items:
+            if item.track is None:
+                # the track is no longer available on Spotify
+                continue
+            album = item.track_album
+            tracks.append(CatalogTrack(
+                item.track.uri, item.track.name, catalog_key(album.id, album.name), album.name,
+                [(catalog_key(artist.id, artist.name), artist.name) for artist in item.track.artists]))
+        return self._insert_catalog_tracks(cursor, tracks, catalog)
+
+    def _insert_catalog_tracks(self,
+                               cursor: sqlite3.Cursor,
+                               tracks: List["CatalogTrack"],
+                               catalog: CatalogIds) -> List[int]:
+        """adds tracks to the catalog with one executemany per table. Albums, artists
+        and tracks are only added the first time their Spotify ID or uri is seen
+
+        Returns:
+            List[int]: the Tracks ids in the same order as tracks
+        """
+        if not tracks:
+            return []
+        albums: Dict[str, str] = {}
+        artists: Dict[str, str] = {}
+        new_tracks: Dict[str, CatalogTrack] = {}
+        for track in tracks:
+            if track.uri in catalog.tracks:
+                continue
+            new_tracks[track.uri] = track
+            albums[track.album_key] = track.album_name
+            artists.update(track.artists)
+        # tracks stored by an earlier backup keep their row and artists
+        uris = list(new_tracks)
+        for start in range(0, len(uris), 500):
+            chunk = uris[start:start + 500]
+            cursor.execute(
+                f"SELECT uri, id FROM Tracks WHERE uri IN ({','.join('?' * len(chunk))})", chunk)
+            for uri, track_id in cursor.fetchall():
+                catalog.tracks[uri] = track_id
+                del new_tracks[uri]
+        if new_tracks:
+            self._upsert_catalog(cursor, "Albums", albums, catalog.albums)
+            self._upsert_catalog(cursor, "Artists", artists, catalog.artists)
+            # the ids are handed out here instead of reading lastrowid after every row.
+            # Safe as the storage thread is the only writer and this runs inside its transaction
+            track_id = self._next_id(cursor, "Tracks")
+            rows, track_artists = [], []
+            for index, track in enumerate(new_tracks.values()):
+                rows.append((track_id + index, track.uri, track.name, catalog.albums[track.album_key]))
+                for position, (artist_key, _) in enumerate(track.artists):
+                    track_artists.append((track_id + index, catalog.artists[artist_key], position))
+                catalog.tracks[track.uri] = track_id + index
+            cursor.executemany(
+                "INSERT INTO Tracks (id, uri, name, album_id) VALUES (?, ?, ?, ?)", rows)
+            cursor.executemany('''
+            INSERT INTO TrackArtists (track_id, artist_id, position) VALUES (?, ?, ?)''', track_artists)
+            if self.search_enabled:
+                cursor.executemany('''
+                INSERT INTO TrackSearch (rowid, name, artists, album) VALUES (?, ?, ?, ?)''',
+                                   [(track_id + index, track.name,
+                                     " ".join(name for _, name in track.artists), track.album_name)
+                                    for index, track in enumerate(new_tracks.values())])
+        return [catalog.tracks[track.uri] for track in tracks]
 
     async def create_backup_directory(self, user: SpotifyUser) -> str:
         """creates a folder named after the UserID if doesnt exist
@@ -356,27 +2101,240 @@ class PlaylistManager:
             # path already exists
             pass
         finally:
+            self.user = user
             self.db_path = os.path.join(user_path, DATABASE_FILENAME)
+            if self.storage is not None:
+                self.storage.close()
+            self.storage = BackupStorage(self.db_path)
             await self.create_tables()
             return self.db_path
 
+    def close(self):
+        """stops the storage thread. Call when the app is closing
+        """
+        if self.storage is not None:
+            self.storage.close()
+            self.storage = None
+
     async def create_tables(self):
-        with BackupSQlite(self.db_path) as cursor:
-            # setup the database
-            await self.create_backup_table(cursor)
-            await self.create_playlists_table(cursor)
-            await self.create_album_table(cursor)
-            await self.create_artists_table(cursor)
-            await self.create_track_table(cursor)
-
-    async def create_backup_table(self, cursor: sqlite3.Cursor):
+        migrated = await self.storage.transaction(self._create_tables)
+        if migrated:
+            # give the space of the old tables back to the file system
+            await self.storage.vacuum()
+
+    def _create_tables(self, cursor: sqlite3.Cursor) -> bool:
+        # setup the database
+        self.create_backup_table(cursor)
+        self.create_playlists_table(cursor)
+        self.create_album_table(cursor)
+        self.create_artists_table(cursor)
+        self.create_track_table(cursor)
+        self.create_track_artists_table(cursor)
+        self.create_pages_table(cursor)
+        self.create_page_hashes_table(cursor)
+        self.create_restore_tables(cursor)
+        self.migrate_playlists_table(cursor)
+        migrated = self.migrate_schema(cursor)
+        # after the migration as it rebuilds the Tracks table
+        self.create_indexes(cursor)
+        self.create_track_playlists_table(cursor)
+        self.search_enabled = self.create_search_table(cursor)
+        return migrated
+
+    def create_track_playlists_table(self, cursor: sqlite3.Cursor):
+        cursor.execute("PRAGMA table_info(TrackPlaylists)")
+        columns = [row[1] for row in cursor.fetchall()]
+        if "last_row_id" in columns:
+            return
+        if columns:
+            # SCHEMA_VERSION 4 only kept the first backup. Built again from the stored playlists
+            cursor.execute("DROP TABLE TrackPlaylists")
+        cursor.execute('''
+        CREATE TABLE TrackPlaylists(
+            track_id INTEGER NOT NULL,
+            playlist_id TEXT NOT NULL,
+            first_backup_id INTEGER NOT NULL,
+            last_row_id INTEGER,
+            PRIMARY KEY (track_id, playlist_id),
+            FOREIGN KEY (track_id) REFERENCES Tracks(id),
+            FOREIGN KEY (first_backup_id) REFERENCES Backups(id),
+            FOREIGN KEY (last_row_id) REFERENCES Playlists(id)
+        ) WITHOUT ROWID;
+        ''')
+        # fill it in from the playlists already stored, oldest first
+        reader = cursor.connection.execute('''
+        SELECT id, playlist_id, backup_id FROM Playlists
+        WHERE source_id IS NULL AND (track_list IS NOT NULL OR delta IS NOT NULL) ORDER BY id''')
+        for row_id, playlist_id, backup_id in reader:
+            self._index_playlist_tracks(
+                cursor, playlist_id, backup_id, row_id, self._get_track_list(cursor, row_id))
+        reader.close()
+
+    def create_search_table(self, cursor: sqlite3.Cursor) -> bool:
+        """creates the TrackSearch full text index and fills it in from the Tracks catalog
+        if it is new
+
+        Returns:
+            bool: False if FTS5 is not available
+        """
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'TrackSearch'")
+        if cursor.fetchone() is not None:
+            return True
+        try:
+            # prefix indexes keep the search as you type queries fast
+            cursor.execute('''
+            CREATE VIRTUAL TABLE TrackSearch USING fts5(
+                name, artists, album, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')''')
+        except sqlite3.OperationalError as err:
+            globals.logger.console(f"Track search is not available. {err}", "warning")
+            return False
+        cursor.execute('''
+        INSERT INTO TrackSearch (rowid, name, artists, album)
+        SELECT Tracks.id, Tracks.name,
+        (SELECT group_concat(name, ' ') FROM (
+            SELECT Artists.name FROM TrackArtists JOIN Artists ON Artists.id = TrackArtists.artist_id
+            WHERE TrackArtists.track_id = Tracks.id ORDER BY TrackArtists.position)),
+        Albums.name
+        FROM Tracks LEFT JOIN Albums ON Albums.id = Tracks.album_id''')
+        return True
+
+    def create_indexes(self, cursor: sqlite3.Cursor):
+        # Tracks.uri is UNIQUE so it already has an index
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_playlists_backup ON Playlists(backup_id, id)")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_playlists_playlist ON Playlists(playlist_id, id)")
+        # finds the backups sharing a stored version, see _search_tracks
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_playlists_source ON Playlists(source_id)")
+
+    def migrate_schema(self, cursor: sqlite3.Cursor) -> bool:
+        """brings databases created by older versions up to SCHEMA_VERSION
+
+        Returns:
+            bool: True if any tables were rebuilt
+        """
+        cursor.execute("PRAGMA user_version")
+        version = cursor.fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return False
+        rebuilt = False
+        cursor.execute("PRAGMA table_info(Albums)")
+        if "spotify_id" not in [row[1] for row in cursor.fetchall()]:
+            self.migrate_catalog_tables(cursor)
+            rebuilt = True
+        cursor.execute("PRAGMA table_info(Tracks)")
+        if "playlist_id" in [row[1] for row in cursor.fetchall()]:
+            self.migrate_track_lists(cursor)
+            rebuilt = True
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return rebuilt
+
+    def migrate_catalog_tables(self, cursor: sqlite3.Cursor):
+        """converts the row per track Albums and comma joined Artists into the Spotify ID
+        keyed tables. The old rows never stored the Spotify ID so albums and artists
+        are merged by name
+        """
+        globals.logger.console("Migrating Albums and Artists to the ID keyed schema...")
+        # stops the rename from pointing the TrackArtists foreign key at Tracks_v0
+        cursor.execute("PRAGMA legacy_alter_table = ON")
+        cursor.execute("ALTER TABLE Tracks RENAME TO Tracks_v0")
+        cursor.execute("ALTER TABLE Albums RENAME TO Albums_v0")
+        cursor.execute("ALTER TABLE Artists RENAME TO Artists_v0")
+        self.create_album_table(cursor)
+        self.create_artists_table(cursor)
+        # the version 1 layout. migrate_track_lists turns it into the catalog
+        cursor.execute('''
+        CREATE TABLE Tracks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            uri TEXT NOT NULL,
+            name TEXT NOT NULL,
+            playlist_id INTEGER,
+            album_id INTEGER
+        );
+        ''')
+        cursor.execute('''
+        INSERT INTO Albums (spotify_id, name)
+        SELECT DISTINCT 'name:' || COALESCE(name, ''), name FROM Albums_v0''')
+        cursor.execute('''
+        INSERT INTO Tracks (id, uri, name, playlist_id, album_id)
+        SELECT Tracks_v0.id, Tracks_v0.uri, Tracks_v0.name, Tracks_v0.playlist_id, Albums.id
+        FROM Tracks_v0
+        LEFT JOIN Albums_v0 ON Albums_v0.id = Tracks_v0.album_id
+        LEFT JOIN Albums ON Albums.spotify_id = 'name:' || COALESCE(Albums_v0.name, '')''')
+        # split the comma joined names in chunks so large databases are not read into memory
+        artist_ids: Dict[str, int] = {}
+        reader = cursor.connection.execute('''
+        SELECT Tracks_v0.id, Artists_v0.name FROM Tracks_v0
+        JOIN Artists_v0 ON Artists_v0.id = Tracks_v0.artists_id''')
+        while True:
+            rows = reader.fetchmany(WRITE_BATCH_SIZE * 100)
+            if not rows:
+                break
+            rows = [(track_id, [name for name in (joined or "").split(",") if name])
+                    for track_id, joined in rows]
+            names = {catalog_key(None, name): name for _, split in rows for name in split}
+            self._upsert_catalog(cursor, "Artists", names, artist_ids)
+            cursor.executemany(
+                "INSERT INTO TrackArtists (track_id, artist_id, position) VALUES (?, ?, ?)",
+                [(track_id, artist_ids[catalog_key(None, name)], position)
+                 for track_id, split in rows
+                 for position, name in enumerate(split)])
+        reader.close()
+        cursor.execute("DROP TABLE Tracks_v0")
+        cursor.execute("DROP TABLE Albums_v0")
+        cursor.execute("DROP TABLE Artists_v0")
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+
+    def migrate_track_lists(self, cursor: sqlite3.Cursor):
+        """converts the row per playlist track Tracks table into the catalog of unique uris
+        and packs every playlists tracks into its track_list
+        """
+        globals.logger.console("Migrating Tracks to the track catalog...")
+        cursor.execute("PRAGMA legacy_alter_table = ON")
+        cursor.execute("ALTER TABLE Tracks RENAME TO Tracks_v1")
+        cursor.execute("ALTER TABLE TrackArtists RENAME TO TrackArtists_v1")
+        self.create_track_table(cursor)
+        self.create_track_artists_table(cursor)
+        # the first stored copy of every uri becomes its catalog row
+        cursor.execute('''
+        INSERT INTO Tracks (uri, name, album_id)
+        SELECT uri, name, album_id FROM Tracks_v1
+        WHERE id IN (SELECT MIN(id) FROM Tracks_v1 GROUP BY uri) ORDER BY id''')
+        cursor.execute('''
+        INSERT INTO TrackArtists (track_id, artist_id, position)
+        SELECT Tracks.id, TrackArtists_v1.artist_id, TrackArtists_v1.position FROM Tracks_v1
+        JOIN Tracks ON Tracks.uri = Tracks_v1.uri
+        JOIN TrackArtists_v1 ON TrackArtists_v1.track_id = Tracks_v1.id
+        WHERE Tracks_v1.id IN (SELECT MIN(id) FROM Tracks_v1 GROUP BY uri)''')
+        # one playlist in memory at a time
+        reader = cursor.connection.execute('''
+        SELECT Tracks_v1.playlist_id, Tracks.id FROM Tracks_v1
+        JOIN Tracks ON Tracks.uri = Tracks_v1.uri
+        ORDER BY Tracks_v1.playlist_id, Tracks_v1.id''')
+        playlist_id, track_ids = None, []
+        for row_playlist_id, track_id in reader:
+            if row_playlist_id != playlist_id:
+                if playlist_id is not None:
+                    self._set_playlist_track_list(cursor, playlist_id, track_ids)
+                playlist_id, track_ids = row_playlist_id, []
+            track_ids.append(track_id)
+        if playlist_id is not None:
+            self._set_playlist_track_list(cursor, playlist_id, track_ids)
+        reader.close()
+        cursor.execute("DROP TABLE Tracks_v1")
+        cursor.execute("DROP TABLE TrackArtists_v1")
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+
+    def create_backup_table(self, cursor: sqlite3.Cursor):
         cursor.execute('''CREATE TABLE IF NOT EXISTS Backups (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         name TEXT,
                         description TEXT,
                         date_added DATETIME NOT NULL);''')
 
-    async def create_playlists_table(self, cursor: sqlite3.Cursor):
+    def create_playlists_table(self, cursor: sqlite3.Cursor):
         cursor.execute('''CREATE TABLE IF NOT EXISTS Playlists (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             playlist_id TEXT NOT NULL,
@@ -385,36 +2343,124 @@ class PlaylistManager:
             description TEXT,
             total_songs INTEGER,
             backup_id INTEGER,
-            FOREIGN KEY (backup_id) REFERENCES Backups(id));
+            snapshot_id TEXT,
+            source_id INTEGER,
+            track_list BLOB,
+            base_id INTEGER,
+            delta BLOB,
+            delta_depth INTEGER,
+            FOREIGN KEY (backup_id) REFERENCES Backups(id),
+            FOREIGN KEY (base_id) REFERENCES Playlists(id),
+            FOREIGN KEY (source_id) REFERENCES Playlists(id));
         ''')
 
-    async def create_track_table(self, cursor: sqlite3.Cursor):
+    def migrate_playlists_table(self, cursor: sqlite3.Cursor):
+        """adds the snapshot_id and source_id columns to databases created before incremental backups.
+        source_id is NULL when the row holds its own tracks. Also adds the track_list and delta columns
+        """
+        cursor.execute("PRAGMA table_info(Playlists)")
+        columns = [row[1] for row in cursor.fetchall()]
+        if "snapshot_id" not in columns:
+            cursor.execute("ALTER TABLE Playlists ADD COLUMN snapshot_id TEXT")
+        if "source_id" not in columns:
+            cursor.execute(
+                "ALTER TABLE Playlists ADD COLUMN source_id INTEGER REFERENCES Playlists(id)")
+        if "track_list" not in columns:
+            cursor.execute("ALTER TABLE Playlists ADD COLUMN track_list BLOB")
+        if "base_id" not in columns:
+            cursor.execute(
+                "ALTER TABLE Playlists ADD COLUMN base_id INTEGER REFERENCES Playlists(id)")
+            cursor.execute("ALTER TABLE Playlists ADD COLUMN delta BLOB")
+            cursor.execute("ALTER TABLE Playlists ADD COLUMN delta_depth INTEGER")
+
+    def create_track_table(self, cursor: sqlite3.Cursor):
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS Tracks (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            uri TEXT NOT NULL,
+            uri TEXT NOT NULL UNIQUE,
             name TEXT NOT NULL,
-            playlist_id INTEGER,
-            artists_id INTEGER,
             album_id INTEGER,
-            FOREIGN KEY (playlist_id) REFERENCES Playlist(id),
-            FOREIGN KEY (artists_id) REFERENCES Artists(id),
-            FOREIGN KEY (album_id) REFERENCES Album(id)
+            FOREIGN KEY (album_id) REFERENCES Albums(id)
         );
         ''')
 
-    async def create_album_table(self, cursor: sqlite3.Cursor):
+    def create_track_artists_table(self, cursor: sqlite3.Cursor):
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TrackArtists(
+            track_id INTEGER NOT NULL,
+            artist_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (track_id, position),
+            FOREIGN KEY (track_id) REFERENCES Tracks(id),
+            FOREIGN KEY (artist_id) REFERENCES Artists(id)
+        );
+        ''')
+
+    def create_pages_table(self, cursor: sqlite3.Cursor):
+        # the compressed response bodies of raw backups
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Pages(
+            playlist_id INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            compression TEXT NOT NULL,
+            body BLOB NOT NULL,
+            PRIMARY KEY (playlist_id, offset),
+            FOREIGN KEY (playlist_id) REFERENCES Playlists(id)
+        );
+        ''')
+
+    def create_page_hashes_table(self, cursor: sqlite3.Cursor):
+        # where the tracks of every page of a catalogued playlist are in its track_list
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS PageHashes(
+            playlist_id INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            hash BLOB NOT NULL,
+            first_index INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (playlist_id, offset),
+            FOREIGN KEY (playlist_id) REFERENCES Playlists(id)
+        ) WITHOUT ROWID;
+        ''')
+
+    def create_restore_tables(self, cursor: sqlite3.Cursor):
+        # the journal of restore_backup
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Restores(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            backup_id INTEGER NOT NULL,
+            date_started DATETIME NOT NULL,
+            date_finished DATETIME,
+            FOREIGN KEY (backup_id) REFERENCES Backups(id)
+        );
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS RestorePlaylists(
+            restore_id INTEGER NOT NULL,
+            playlist_id INTEGER NOT NULL,
+            target_id TEXT,
+            tracks_added INTEGER NOT NULL DEFAULT 0,
+            finished INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (restore_id, playlist_id),
+            FOREIGN KEY (restore_id) REFERENCES Restores(id),
+            FOREIGN KEY (playlist_id) REFERENCES Playlists(id)
+        ) WITHOUT ROWID;
+        ''')
+
+    def create_album_table(self, cursor: sqlite3.Cursor):
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS Albums(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            spotify_id TEXT NOT NULL UNIQUE,
             name TEXT
         );
         ''')
 
-    async def create_artists_table(self, cursor: sqlite3.Cursor):
+    def create_artists_table(self, cursor: sqlite3.Cursor):
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS Artists(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            spotify_id TEXT NOT NULL UNIQUE,
             name TEXT
         );
         ''')
@@ -422,8 +2468,9 @@ class PlaylistManager:
 
 def retry_on_limit_exceeded(delay: int, timeout_factor: float):
     """retries if spotify responds with limit exceeded code
-    will sleep for delay period timeout_factor gets added on everytime
-    the response is 428 code
+    the wait is handed to spotify.net.governor so every running request backs off together.
+    delay is only used if the response had no Retry-After and timeout_factor gets added on everytime
+    the response is 429 code
 
     Args:
         delay (int): the start delay in seconds
@@ -435,7 +2482,7 @@ def retry_on_limit_exceeded(delay: int, timeout_factor: float):
             nonlocal delay
             nonlocal timeout_factor
             # infinte loop may change this later on but for now the function will keep
-            # looping on every unsuccessful 428 code resquest
+            # looping on every unsuccessful 429 code resquest
             while True:
                 try:
                     result = await func(*args, **kwargs)
@@ -444,9 +2491,11 @@ def retry_on_limit_exceeded(delay: int, timeout_factor: float):
                     # check for a maximum limit exceeded from the server
                     if isinstance(e, spotify.net.SpotifyError) and \
                             e.code == spotify.constants.STATUS_LIMIT_RATE_REACHED:
+                        retry_after = e.retry_after if e.retry_after is not None else delay
                         globals.logger.console(
-                            f"Maximum requests limit reached waiting {delay} seconds for next retry request...")
-                        await asyncio.sleep(delay)
+                            f"Maximum requests limit reached waiting {retry_after} seconds for next retry request...")
+                        spotify.net.governor.throttle(retry_after)
+                        await spotify.net.governor.wait()
                         delay += timeout_factor
                     else:
                         raise e
@@ -466,61 +2515,28 @@ async def get_tracks_with_retry(*args, **kwargs) -> Tracks:
     return await spotify.net.get_playlist_tracks(*args, **kwargs)
 
 
-async def fetch_and_insert_tracks(
-        token: str,
-        playlist_id: str,
-        offset: int,
-        limit_per_request: int):
-    """get the next tracks listing from the offset and loop through each track and store to
-    the database
-
-    Args:
-        token (str): access token
-        playlist_id (str): ID of the playlist to get the tracks from
-        offset (int): the current offset
-        limit_per_request (int): the amount of tracks to return (Maximum is 50)
-    """
-    globals.logger.console(
-        f'Fetching next tracks from Playlist ID {playlist_id} offset: {offset}')
-    tracks = await get_tracks_with_retry(
-        access_token=token, playlist_id=playlist_id, offset=offset, limit=limit_per_request
-    )
-    # insert into database here
-    for item in tracks.items:
-        globals.logger.console(item.track.name)
-
-
 async def handle_tracks(playlist_item: PlaylistItem, token: str, limit_per_request: int):
     """is the tracks handler for the current playlist that requires pagination
-    change MAX_TRACKS_CONNECT to increase or decrease the amount of connections
+    the pages are requested concurrently by spotify.net.iter_playlist_track_pages
 
     Args:
         playlist_item (PlaylistItem): the playlist item to get the track listings from
         token (str): the access token
         limit_per_request (int): the amount of tracks to return from the request
     """
-    # keeps track of the loop offset and checks limit and total
-    # creates a new fetch_and_insert_tracks
-    offset = 0
-    fetch_tasks = []
-    for tracks_index in range(playlist_item.tracks.total):
-        loop = asyncio.get_event_loop()
-        fetch_tasks.append(loop.create_task(fetch_and_insert_tracks(
-            token, playlist_item.id, offset, limit_per_request)))
-        if len(fetch_tasks) >= MAX_TRACKS_CONNECT:
-            result = asyncio.gather(*fetch_tasks)
-            await result
-            fetch_tasks = []
-            offset += limit_per_request
-    if fetch_tasks:
-        await asyncio.gather(*fetch_tasks)
+    globals.logger.console(f'Fetching tracks from Playlist ID {playlist_item.id}')
+    async for tracks in spotify.net.iter_playlist_track_pages(
+            token, playlist_item.id, limit=limit_per_request):
+        # insert into database here
+        for item in tracks.items:
+            globals.logger.console(item.track_name)
 
 
 async def fetch_and_insert_playlists(token, offset, limit):
     playlists = await get_playlists_with_retry(
         token=token, url="", offset=offset, limit=limit)
     for playlist_item in playlists.items:
-        await handle_tracks(playlist_item, token, limit)
+        await handle_tracks(playlist_item, token, spotify.net.MAX_TRACKS_PAGE_LIMIT)
 
 
 async def handle_playlists(playlist_info: Playlists, token: str, limit=50):
@@ -542,7 +2558,7 @@ async def backup_the_playlists(token: str):
     # insert the backup table here
     playlists_info: Playlists = await spotify.net.get_playlists(token, limit=50)
     await handle_playlists(playlist_info=playlists_info, token=token, limit=50)
-    globals.logger.console("All complete")
+    globals.logger.console(f"All complete. Rate limiting: {spotify.net.governor.stats()}")
 
 
 async def _test():
@@ -0,0 +1,205 @@
+"""
+cache.py - on disk cache of Spotify GET responses. Responses are stored with their ETag
+so the next request for the same url can send If-None-Match and a 304 Not Modified
+response gets served from the disk instead of downloading the whole payload again
+"""
+
+import os
+import sqlite3
+import time
+import zlib
+import hashlib
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from spotify import debugging
+
+
+CACHE_DIR = os.path.join(debugging.APP_SETTINGS_DIR, "cache")
+CACHE_FILENAME = "responses.db"
+# the least recently used responses get removed once the stored bodies go over this size
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    etag: str
+    body: bytes
+
+
+class ResponseCache:
+
+    """size bounded LRU cache of response bodies keyed by the account, url and params.
+    All the sqlite work is done on a single worker thread so the event loop is never blocked
+    """
+
+    def __init__(self, path: str, max_bytes: int = MAX_CACHE_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ResponseCache")
+        self._conn: sqlite3.Connection = None
+        self._total_bytes = 0
+        # Spotify user ID the responses belong to. The cache is shared by every login
+        # so nothing is cached until the account is known
+        self.account: str = None
+
+    def set_account(self, account: Optional[str]):
+        """responses are only served to requests from the same account
+
+        Args:
+            account (Optional[str]): the Spotify user ID. None when the user is not known
+        """
+        self.account = account
+
+    def make_key(self, url: str, params: dict = None) -> str:
+        """creates the cache key from the account, the url and the query params
+
+        Args:
+            url (str): the request url
+            params (dict, optional): the query params. Defaults to None.
+
+        Returns:
+            str: sha1 hex digest
+        """
+        query = "&".join(f"{key}={params[key]}" for key in sorted(params)) if params else ""
+        return hashlib.sha1(f"{self.account}:{url}?{query}".encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        # only ever called from the worker thread
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS Responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL);''')
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_last_used ON Responses(last_used)")
+            self._total_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM Responses").fetchone()[0]
+        return self._conn
+
+    def _get(self, key: str) -> Optional[CachedResponse]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT url, etag, body FROM Responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute(
+                "UPDATE Responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return CachedResponse(url=row[0], etag=row[1], body=zlib.decompress(row[2]))
+
+    def _put(self, key: str, url: str, etag: str, body: bytes):
+        conn = self._connect()
+        compressed = zlib.compress(body, 1)
+        with conn:
+            previous = conn.execute(
+                "SELECT size FROM Responses WHERE key = ?", (key,)).fetchone()
+            if previous is not None:
+                self._total_bytes -= previous[0]
+            conn.execute('''INSERT OR REPLACE INTO Responses
+                (key, url, etag, body, size, last_used) VALUES (?, ?, ?, ?, ?, ?)''',
+                         (key, url, etag, compressed, len(compressed), time.time()))
+            self._total_bytes += len(compressed)
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        # remove the least recently used until we are back under the limit
+        while self._total_bytes > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM Responses ORDER BY last_used LIMIT 100").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            for key, size in rows:
+                conn.execute("DELETE FROM Responses WHERE key = ?", (key,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def _clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM Responses")
+        self._total_bytes = 0
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        """gets the stored response and marks it as recently used
+
+        Args:
+            key (str): key from make_key
+
+        Returns:
+            Optional[CachedResponse]: None if nothing is stored
+        """
+        return await self._run(self._get, key)
+
+    async def put(self, key: str, url: str, etag: str, body: bytes):
+        """stores the response body and its ETag. Evicts old responses if over max_bytes
+
+        Args:
+            key (str): key from make_key
+            url (str): the url the response came from
+            etag (str): the ETag header of the response
+            body (bytes): the response body
+        """
+        await self._run(self._put, key, url, etag, body)
+
+    async def clear(self):
+        await self._run(self._clear)
+
+    def close(self):
+        """closes the database and stops the worker thread. Waits for any pending writes
+        """
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "bytes": self._total_bytes}
+
+
+_cache: ResponseCache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    """the shared ResponseCache stored in the APP_SETTINGS_DIR
+
+    Returns:
+        ResponseCache
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(os.path.join(CACHE_DIR, CACHE_FILENAME))
+        return _cache
+
+
+def close_cache():
+    """closes the shared ResponseCache. Call when the app is closing
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
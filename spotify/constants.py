@@ -9,6 +9,8 @@ PLAYLIST_READ_COLLABORATIVE = "playlist-read-collaborative"
 
 # STATUS CODES
 STATUS_OK = 200
+STATUS_CREATED = 201
+STATUS_NOT_MODIFIED = 304
 STATUS_BAD_TOKEN = 401
 STATUS_BAD_OAUTH_REQUEST = 403
 STATUS_LIMIT_RATE_REACHED = 429
@@ -24,4 +26,41 @@ URI_PLAYLISTS = "https://api.spotify.com/v1/me/playlists"
 URI_PLAYLIST = lambda playlist_id : f"https://api.spotify.com/v1/playlists/{playlist_id}"
 URI_PLAYLIST_TRACKS = lambda playlist_id : f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
 
-URI_USER = "https://api.spotify.com/v1/me"
\ No newline at end of file
+URI_USER = "https://api.spotify.com/v1/me"
+URI_USER_PLAYLISTS = lambda user_id : f"https://api.spotify.com/v1/users/{user_id}/playlists"
+
+# FIELDS FILTERS
+# passed as the fields query param so Spotify only returns what we use. The biggest saving is
+# available_markets which is a list of around 180 country codes on every track and album
+# check spotify.validators.tracks, spotify.validators.playlist and spotify.validators.playlists
+# if you add or remove any fields
+
+# paging information returned with every page of tracks
+_FIELDS_TRACKS_PAGING = "href,limit,next,offset,previous,total"
+
+# displaying tracks in the TracksCtrl
+FIELDS_TRACKS_LISTING = \
+    "items(added_at,track(name,uri,album(name,artists(name)),artists(name)))," + _FIELDS_TRACKS_PAGING
+
+# backing up tracks. Everything Spotify returns apart from available_markets.
+# without the paging fields a page body only changes when its tracks do so it can be hashed
+FIELDS_TRACKS_BACKUP_ITEMS = \
+    "items(added_at,added_by(id,type,uri),is_local,track(" \
+    "id,name,uri,href,type,is_local,episode,track,explicit,popularity,preview_url," \
+    "disc_number,track_number,duration_ms,external_ids,external_urls," \
+    "album(id,name,uri,href,type,album_type,release_date,release_date_precision," \
+    "total_tracks,images,external_urls,artists(id,name,uri,href,type,external_urls))," \
+    "artists(id,name,uri,href,type,external_urls)))"
+FIELDS_TRACKS_BACKUP = f"{FIELDS_TRACKS_BACKUP_ITEMS},{_FIELDS_TRACKS_PAGING}"
+
+# restoring tracks only needs the uri
+FIELDS_TRACKS_RESTORE = "items(is_local,track(uri))," + _FIELDS_TRACKS_PAGING
+
+# the playlist with its first page of tracks for the TracksCtrl
+FIELDS_PLAYLIST_LISTING = f"id,name,snapshot_id,tracks({FIELDS_TRACKS_LISTING})"
+
+# the users playlists. images are left out
+FIELDS_PLAYLISTS = \
+    "href,limit,next,offset,previous,total," \
+    "items(collaborative,description,external_urls,href,id,name,public,snapshot_id,type,uri," \
+    "owner(display_name,external_urls,href,id,type,uri),tracks(href,total))"
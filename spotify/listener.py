@@ -132,7 +132,7 @@ class RedirectListener(threading.Thread):
                         first_space = string.index(" ")
                         code = string[:first_space]
                         try:
-                            # send an async request to obtain the token
+                            # send an async request to obtain the token info
                             token = spotify.net.await_on_sync_call(
                                 spotify.net.exchange_code_for_token, 
                                 client_id=self.client_id,
@@ -2,8 +2,24 @@ import aiohttp
 import logging
 import asyncio
 import base64
+import collections
+import itertools
+import json
+import random
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Mapping, Type
+
+from pydantic import BaseModel
+
+from yarl import URL
 
 import spotify.constants as constants
+import spotify.cache
 import spotify.validators.tracks
 import spotify.validators.user
 import spotify.validators.playlist
@@ -12,12 +28,164 @@ import spotify.validators.playlists
 
 logger = logging.getLogger()
 
+# connection pool settings for the shared SpotifyClient session
+# total amount of open sockets the session can hold at once
+MAX_CONNECTIONS = 30
+# api.spotify.com and accounts.spotify.com get their own limit each
+MAX_CONNECTIONS_PER_HOST = 10
+# seconds to keep resolved hosts before looking them up again
+DNS_CACHE_TTL = 600
+# seconds an idle socket is kept open for the next request
+KEEPALIVE_TIMEOUT = 60
+# seconds before a request is given up on
+REQUEST_TIMEOUT = 60
+
+# seconds to wait after a 429 if Spotify didnt send a Retry-After header
+DEFAULT_RETRY_AFTER = 1.0
+# maximum random seconds added to each held back request when the window reopens
+RATE_LIMIT_JITTER = 0.5
+# how many times a request is resent after a 429 before the error is raised
+MAX_RATE_LIMIT_RETRIES = 5
+
+# the maximum amount of tracks Spotify returns in one page
+MAX_TRACKS_PAGE_LIMIT = 100
+# amount of track pages requested at the same time when paginating a playlist
+MAX_CONCURRENT_PAGES = 8
+# the most track uris Spotify takes in one add or remove request
+MAX_TRACKS_PER_WRITE = 100
+
 
 class SpotifyError(Exception):
-    def __init__(self, code: int, text: str, *args, **kwargs):
+    def __init__(self, code: int, text: str, *args, retry_after: float = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.response_text = text
         self.code = code
+        # seconds Spotify asked us to wait. Only set on a 429 response
+        self.retry_after = retry_after
+
+
+@dataclass
+class SpotifyResponse:
+
+    """the fully read response from the Spotify API. The body is read before the
+    connection is handed back to the pool so the response can be used after the request has finished
+    """
+
+    status: int
+    reason: str
+    url: str
+    headers: Mapping[str, str]
+    body: bytes
+
+    def json(self) -> dict:
+        return json.loads(self.body)
+
+
+class RateLimitGovernor:
+
+    """process wide gate for every request sent to Spotify. When a 429 is received
+    the window is closed for the Retry-After period and every request waiting to be sent
+    is held back until it reopens. The requests are released with a small random jitter
+    so they dont all hit the API again in the same instant.
+
+    Uses time.monotonic and a threading lock so it works across the event loops of
+    the main thread and the RedirectListener thread
+    """
+
+    def __init__(self, jitter: float = RATE_LIMIT_JITTER) -> None:
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self._resume_at: float = 0.0
+        self.reset_stats()
+
+    def reset_stats(self):
+        """resets the throttling counters
+        """
+        with self._lock:
+            # amount of 429 responses received
+            self.throttle_events: int = 0
+            # wall clock seconds the window has been closed for
+            self.throttled_seconds: float = 0.0
+            # amount of requests that had to wait for the window to reopen
+            self.held_requests: int = 0
+            # seconds waited summed over every held request
+            self.held_seconds: float = 0.0
+
+    @property
+    def is_throttled(self) -> bool:
+        return time.monotonic() < self._resume_at
+
+    def throttle(self, retry_after: float):
+        """closes the window for retry_after seconds. Extends the window if it is already closed
+
+        Args:
+            retry_after (float): seconds from the Retry-After header
+        """
+        with self._lock:
+            now = time.monotonic()
+            resume_at = now + retry_after
+            self.throttle_events += 1
+            if resume_at > self._resume_at:
+                # only count the part of the window that wasnt already closed
+                self.throttled_seconds += resume_at - max(now, self._resume_at)
+                self._resume_at = resume_at
+
+    async def wait(self):
+        """returns straight away if the window is open. Otherwise sleeps until
+        the window reopens plus a random jitter
+        """
+        delay = self._resume_at - time.monotonic()
+        if delay <= 0:
+            return
+        started = time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay + random.uniform(0, self.jitter))
+            # the window may have been extended by another 429 while we slept
+            delay = self._resume_at - time.monotonic()
+        with self._lock:
+            self.held_requests += 1
+            self.held_seconds += time.monotonic() - started
+
+    def stats(self) -> dict:
+        """the throttling counters
+
+        Returns:
+            dict: throttle_events, throttled_seconds, held_requests and held_seconds
+        """
+        with self._lock:
+            return {
+                "throttle_events": self.throttle_events,
+                "throttled_seconds": round(self.throttled_seconds, 2),
+                "held_requests": self.held_requests,
+                "held_seconds": round(self.held_seconds, 2)
+            }
+
+
+# the governor shared by every SpotifyClient
+governor = RateLimitGovernor()
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> float:
+    """reads the Retry-After header. Can either be seconds or a HTTP date
+
+    Args:
+        headers (Mapping[str, str]): the response headers
+
+    Returns:
+        float: seconds to wait. DEFAULT_RETRY_AFTER if the header is missing or cant be read
+    """
+    value = headers.get("Retry-After")
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_date = parsedate_to_datetime(value)
+        return max((retry_date - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
 
 
 def create_auth_header(client_id: str, client_secret: str) -> dict:
@@ -50,6 +218,7 @@ def create_auth_token_header(token: str) -> dict:
 
 def await_on_sync_call(func_to_wait_on: any, **kwargs) -> any:
     """for synchronous calls to the spotify api. Note that this will have blocking behaviour!!
+    the SpotifyClient created for the loop is closed before returning
 
     Args:
         func_to_wait_on (_type_): one of the async functions to be called and blocked
@@ -62,10 +231,65 @@ def await_on_sync_call(func_to_wait_on: any, **kwargs) -> any:
         loop = asyncio.get_event_loop()
     except RuntimeError:
         loop = asyncio.new_event_loop()
-    value = loop.run_until_complete(func_to_wait_on(**kwargs))
+    try:
+        value = loop.run_until_complete(func_to_wait_on(**kwargs))
+    finally:
+        loop.run_until_complete(close_client())
     return value
 
 
+# called with the token of a request that got a 401. Returns a fresh token or None
+TOKEN_REFRESHER_TYPE = Callable[[str], Awaitable[str]]
+_token_refresher: TOKEN_REFRESHER_TYPE = None
+
+
+def set_token_refresher(refresher: TOKEN_REFRESHER_TYPE):
+    """sets the coroutine function that gets a new access token when a request returns a 401.
+    The request is then sent again with the new token
+
+    Args:
+        refresher (TOKEN_REFRESHER_TYPE): takes the expired token and returns a fresh token or None
+    """
+    global _token_refresher
+    _token_refresher = refresher
+
+
+def create_token_info(json_response: dict, refresh_token: str = None) -> dict:
+    """reads the token response from the accounts service
+
+    Args:
+        json_response (dict): the json response from the token endpoint
+        refresh_token (str, optional): used if the response didnt contain a new refresh token. Defaults to None.
+
+    Returns:
+        dict: access_token, refresh_token and expires_at in seconds since the epoch
+    """
+    return {
+        "access_token": json_response["access_token"],
+        "refresh_token": json_response.get("refresh_token", refresh_token),
+        "expires_at": time.time() + json_response.get("expires_in", 3600)
+    }
+
+
+def add_fields_filter(url: str, fields: str) -> str:
+    """adds the fields filter to a url. The next and previous links Spotify returns
+    dont always carry the fields param of the original request
+
+    Args:
+        url (str): the url to follow
+        fields (str): the fields filter. check the FIELDS constants in spotify.constants
+
+    Returns:
+        str: the url with the fields query param
+    """
+    if not fields:
+        return url
+    _url = URL(url)
+    if "fields" in _url.query:
+        return url
+    return str(_url.update_query(fields=fields))
+
+
 def get_event_loop() -> asyncio.AbstractEventLoop:
     try:
         loop = asyncio.get_event_loop()
@@ -75,11 +299,11 @@ def get_event_loop() -> asyncio.AbstractEventLoop:
         return loop
 
 
-def raise_spotify_exception(response: aiohttp.ClientResponse):
+def raise_spotify_exception(response: SpotifyResponse):
     """checks the response.status and raises a SpotifyError
 
     Args:
-        response (aiohttp.ClientResponse): the server response from the Spotify API
+        response (SpotifyResponse): the server response from the Spotify API
 
     Raises:
         SpotifyError: _description_
@@ -97,7 +321,10 @@ def raise_spotify_exception(response: aiohttp.ClientResponse):
             "Wrong Consumer key, Bad Nonce or expired timestamp. You may need to Logout and Login into your account again",
         )
     elif response.status == constants.STATUS_LIMIT_RATE_REACHED:
-        raise SpotifyError(response.status, "The App has exceeded its rate")
+        raise SpotifyError(
+            response.status,
+            "The App has exceeded its rate",
+            retry_after=parse_retry_after(response.headers))
     else:
         raise SpotifyError(
             response.status,
@@ -106,208 +333,771 @@ def raise_spotify_exception(response: aiohttp.ClientResponse):
         )
 
 
-async def authorize(client_id: str, scopes: tuple) -> str:
-    """authorize(scopes)
+class SpotifyClient:
 
-    Args:
-        scopes (tuple): tuple array of scope strings. Check the const file
-
-    Returns:
-        _type_: returns the response url to follow to authenticate and retrieve the token auth
+    """owns a single aiohttp.ClientSession so sockets are kept alive and reused
+    between requests instead of doing a new TCP and TLS handshake for every page.
+    The session is bound to the event loop it was first used on, use get_client
+    to get the client for the running loop
     """
-    # Set up the authorization request
-    auth_params = {
-        "response_type": "code",
-        "redirect_uri": constants.REDIRECT_URI,
-        "scope": " ".join(scopes),
-        "client_id": client_id,
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.get(constants.URL_AUTHORIZE, params=auth_params) as response:
-            if response.status == constants.STATUS_OK:
-                url = response.url.human_repr()
-                return url
-            raise_spotify_exception(response)
 
+    def __init__(self,
+                 limit: int = MAX_CONNECTIONS,
+                 limit_per_host: int = MAX_CONNECTIONS_PER_HOST,
+                 dns_cache_ttl: int = DNS_CACHE_TTL,
+                 keepalive_timeout: int = KEEPALIVE_TIMEOUT,
+                 timeout: int = REQUEST_TIMEOUT,
+                 max_rate_limit_retries: int = MAX_RATE_LIMIT_RETRIES,
+                 cache: spotify.cache.ResponseCache = None) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.max_rate_limit_retries = max_rate_limit_retries
+        # GET responses with an ETag are stored here. None disables caching
+        self.cache = cache
+        self._session: aiohttp.ClientSession = None
+        # identical GET requests still waiting on a response. check _single_flight
+        self._in_flight: Dict[tuple, asyncio.Future] = {}
+        # callers still waiting on each in flight request
+        self._in_flight_waiters: Dict[asyncio.Future, int] = {}
+        # amount of requests that were not sent because an identical one was in flight
+        self.requests_coalesced = 0
+        # expired token: the token it was refreshed to. Callers holding on to an expired
+        # token, like a long backup, dont get a 401 on every request
+        self._refreshed_tokens: Dict[str, str] = {}
 
-async def exchange_code_for_token(client_id: str, client_secret: str, code: str) -> str:
-    """swap the auth code for a token ID
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """the pooled session. Gets created on first use
 
-    Args:
-        client_id (str): the applicatrions client id
-        client_secret (str): the applications client secret
-        code (str): auth code, to get this use the RedirectListener,
-                    exchange_code_for_token will be called within that thread
+        Returns:
+            aiohttp.ClientSession
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": constants.USER_AGENT_HEADER})
+        return self._session
 
-    Returns:
-        str: returns the access token used to authenticate during API calls
-    """
-    token_data = {
-        "grant_type": "authorization_code",
-        "code": code,
-        "redirect_uri": constants.REDIRECT_URI,
-    }
-    token_headers = create_auth_header(client_id, client_secret)
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            constants.URL_TOKEN_AUTHENTICATE, data=token_data, headers=token_headers
-        ) as response:
+    @property
+    def closed(self) -> bool:
+        return self._session is None or self._session.closed
+
+    async def close(self):
+        """closes the session and all the pooled connections
+        """
+        if not self.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "SpotifyClient":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def request(self,
+                      method: str,
+                      url: str,
+                      headers: dict = None,
+                      params: dict = None,
+                      data: dict = None,
+                      json_body: dict = None) -> SpotifyResponse:
+        """sends a request through the pooled session and reads the whole body.
+        GET requests with a cached response send If-None-Match and a 304 is
+        returned as a 200 with the cached body. Nothing is cached until the cache knows the account
+
+        Args:
+            method (str): HTTP method. GET, POST, PUT, DELETE
+            url (str): the url to send the request to
+            headers (dict, optional): request headers. Defaults to None.
+            params (dict, optional): query string params. Defaults to None.
+            data (dict, optional): form data to send. Defaults to None.
+            json_body (dict, optional): sent as the json body. Defaults to None.
+
+        Returns:
+            SpotifyResponse: the status, headers and body of the response
+        """
+        if method != "GET" or self.cache is None or self.cache.account is None:
+            return await self._send_governed(method, url, headers, params, data, json_body)
+        key = self.cache.make_key(url, params)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            headers = {**(headers or {}), "If-None-Match": cached.etag}
+        response = await self._send_governed(method, url, headers, params, data)
+        if cached is not None and response.status == constants.STATUS_NOT_MODIFIED:
+            self.cache.hits += 1
+            return SpotifyResponse(
+                status=constants.STATUS_OK,
+                reason=response.reason,
+                url=response.url,
+                headers=response.headers,
+                body=cached.body)
+        self.cache.misses += 1
+        etag = response.headers.get("ETag")
+        if response.status == constants.STATUS_OK and etag:
+            await self.cache.put(key, response.url, etag, response.body)
+        return response
+
+    async def _send_governed(self,
+                             method: str,
+                             url: str,
+                             headers: dict = None,
+                             params: dict = None,
+                             data: dict = None,
+                             json_body: dict = None) -> SpotifyResponse:
+        # waits on the governor before sending and resends the request if a 429 was returned
+        for attempt in range(self.max_rate_limit_retries + 1):
+            await governor.wait()
+            response = await self._send(method, url, headers, params, data, json_body)
+            if response.status != constants.STATUS_LIMIT_RATE_REACHED:
+                break
+            retry_after = parse_retry_after(response.headers)
+            logger.warning(
+                f"Rate limit reached on {url}. Retrying after {retry_after} seconds")
+            governor.throttle(retry_after)
+        return response
+
+    async def _send(self,
+                    method: str,
+                    url: str,
+                    headers: dict = None,
+                    params: dict = None,
+                    data: dict = None,
+                    json_body: dict = None) -> SpotifyResponse:
+        async with self.session.request(
+                method, url, headers=headers, params=params, data=data, json=json_body) as response:
+            body = await response.read()
+            return SpotifyResponse(
+                status=response.status,
+                reason=response.reason,
+                url=response.url.human_repr(),
+                headers=response.headers,
+                body=body)
+
+    def stats(self) -> dict:
+        """counters for the requests that didnt need to be downloaded
+
+        Returns:
+            dict: requests_coalesced and the cache hits and misses
+        """
+        return {
+            "requests_coalesced": self.requests_coalesced,
+            "cache": self.cache.stats() if self.cache is not None else {}
+        }
+
+    async def _single_flight(self, key: tuple, fetch: Callable[[], Awaitable]) -> any:
+        """callers asking for the same key while a request is in flight wait on that
+        request and share its result instead of sending their own. The request is
+        cancelled once every caller waiting on it has been cancelled
+
+        Args:
+            key (tuple): identifies the request
+            fetch (Callable[[], Awaitable]): coroutine function sending the request
+
+        Returns:
+            any: the result of fetch
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.requests_coalesced += 1
+        else:
+            future = asyncio.ensure_future(fetch())
+            self._in_flight[key] = future
+
+            def on_done(_future: asyncio.Future):
+                if self._in_flight.get(key) is _future:
+                    del self._in_flight[key]
+                # every waiter may have been cancelled. mark the error as retrieved
+                if not _future.cancelled():
+                    _future.exception()
+            future.add_done_callback(on_done)
+        self._in_flight_waiters[future] = self._in_flight_waiters.get(future, 0) + 1
+        try:
+            # a cancelled caller must not cancel the request for everyone else
+            return await asyncio.shield(future)
+        finally:
+            self._in_flight_waiters[future] -= 1
+            if not self._in_flight_waiters[future]:
+                del self._in_flight_waiters[future]
+                if not future.done():
+                    # nobody wants the response anymore. Stop the request and its retries
+                    # and let the next caller send a new one
+                    if self._in_flight.get(key) is future:
+                        del self._in_flight[key]
+                    future.cancel()
+
+    async def get_model(self,
+                        model: Type[BaseModel],
+                        token: str,
+                        url: str,
+                        params: dict = None) -> BaseModel:
+        """sends an authenticated GET request and validates the json response. Identical
+        requests in flight at the same time are sent once and share the parsed result
+
+        Args:
+            model (Type[BaseModel]): the validator to parse the response with
+            token (str): the authenticating token
+            url (str): the url to request
+            params (dict, optional): query string params. Defaults to None.
+
+        Raises:
+            SpotifyError: if the response wasnt a 200
+
+        Returns:
+            BaseModel: instance of model
+        """
+        async def fetch() -> BaseModel:
+            response = await self.authorized_request("GET", url, token, params=params)
             if response.status == constants.STATUS_OK:
-                json_response = await response.json()
-                return json_response["access_token"]
+                return model(**response.json())
             raise_spotify_exception(response)
 
+        key = (model, url, tuple(sorted((params or {}).items())), token)
+        return await self._single_flight(key, fetch)
 
-async def get_playlists(
-    token: str, url: str = "", offset: int = 0, limit: int = 5
-) -> spotify.validators.playlists.Playlists:
-    """requests playlists from the user account.
+    async def authorized_request(self,
+                                 method: str,
+                                 url: str,
+                                 token: str,
+                                 params: dict = None,
+                                 json_body: dict = None) -> SpotifyResponse:
+        """sends a request with the Bearer token. If the token has expired the token refresher
+        is asked for a new token and the request is sent once more
 
-    Args:
-        token (str): _description_
-        url (str, optional): the url to follow. If url is empty then offset \
-            and limit is used as params
-        offset (int, optional): the current offset for the playlists
-        limit (int, optional): limit cannot exceed 50. defaults to 5 for testing
+        Args:
+            method (str): HTTP method
+            url (str): the url to send the request to
+            token (str): the authenticating token
+            params (dict, optional): query string params. Defaults to None.
+            json_body (dict, optional): sent as the json body. Defaults to None.
 
-    Returns:
-        spotify.validators.playlists.Playlists
-    """
-    headers = create_auth_token_header(token)
-    params = {}
-    if not url:
-        url = constants.URI_PLAYLISTS
+        Returns:
+            SpotifyResponse: the response
+        """
+        while token in self._refreshed_tokens:
+            token = self._refreshed_tokens[token]
+        response = await self.request(
+            method, url, headers=create_auth_token_header(token), params=params, json_body=json_body)
+        if response.status != constants.STATUS_BAD_TOKEN or _token_refresher is None:
+            return response
+        new_token = await _token_refresher(token)
+        if not new_token or new_token == token:
+            return response
+        self._refreshed_tokens[token] = new_token
+        return await self.request(
+            method, url, headers=create_auth_token_header(new_token), params=params, json_body=json_body)
+
+    async def authorize(self, client_id: str, scopes: tuple) -> str:
+        """authorize(scopes)
+
+        Args:
+            scopes (tuple): tuple array of scope strings. Check the const file
+
+        Returns:
+            _type_: returns the response url to follow to authenticate and retrieve the token auth
+        """
+        # Set up the authorization request
+        auth_params = {
+            "response_type": "code",
+            "redirect_uri": constants.REDIRECT_URI,
+            "scope": " ".join(scopes),
+            "client_id": client_id,
+        }
+        response = await self.request("GET", constants.URL_AUTHORIZE, params=auth_params)
+        if response.status == constants.STATUS_OK:
+            return response.url
+        raise_spotify_exception(response)
+
+    async def exchange_code_for_token(self, client_id: str, client_secret: str, code: str) -> dict:
+        """swap the auth code for a token ID
+
+        Args:
+            client_id (str): the applicatrions client id
+            client_secret (str): the applications client secret
+            code (str): auth code, to get this use the RedirectListener,
+                        exchange_code_for_token will be called within that thread
+
+        Returns:
+            dict: the access_token used to authenticate during API calls, the refresh_token
+                and expires_at. check create_token_info
+        """
+        token_data = {
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": constants.REDIRECT_URI,
+        }
+        token_headers = create_auth_header(client_id, client_secret)
+        response = await self.request(
+            "POST", constants.URL_TOKEN_AUTHENTICATE, headers=token_headers, data=token_data)
+        if response.status == constants.STATUS_OK:
+            return create_token_info(response.json())
+        raise_spotify_exception(response)
+
+    async def refresh_access_token(self, client_id: str, client_secret: str, refresh_token: str) -> dict:
+        """gets a new access token with the refresh token
+
+        Args:
+            client_id (str): the applications client id
+            client_secret (str): the applications client secret
+            refresh_token (str): the refresh token from exchange_code_for_token
+
+        Returns:
+            dict: check create_token_info
+        """
+        token_data = {
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+        }
+        token_headers = create_auth_header(client_id, client_secret)
+        response = await self.request(
+            "POST", constants.URL_TOKEN_AUTHENTICATE, headers=token_headers, data=token_data)
+        if response.status == constants.STATUS_OK:
+            return create_token_info(response.json(), refresh_token)
+        raise_spotify_exception(response)
+
+    async def get_playlists(
+        self, token: str, url: str = "", offset: int = 0, limit: int = 5,
+        fields: str = constants.FIELDS_PLAYLISTS
+    ) -> spotify.validators.playlists.Playlists:
+        """requests playlists from the user account.
+
+        Args:
+            token (str): _description_
+            url (str, optional): the url to follow. If url is empty then offset \
+                and limit is used as params
+            offset (int, optional): the current offset for the playlists
+            limit (int, optional): limit cannot exceed 50. defaults to 5 for testing
+            fields (str, optional): fields filter. None returns the full objects. Defaults to FIELDS_PLAYLISTS.
+
+        Returns:
+            spotify.validators.playlists.Playlists
+        """
+        params = {}
+        if not url:
+            url = constants.URI_PLAYLISTS
+            params = {"offset": offset, "limit": limit}
+        url = add_fields_filter(url, fields)
+        return await self.get_model(spotify.validators.playlists.Playlists, token, url, params)
+
+    async def get_user_info(self, token: str) -> spotify.validators.user.User:
+        """gets the Users details from the Spotify API
+
+        Args:
+            token (str): the authenticating token
+
+        Returns:
+            spotify.validators.user.User
+        """
+        return await self.get_model(spotify.validators.user.User, token, constants.URI_USER)
+
+    async def get_playlist(
+        self, access_token: str, playlist_id: str,
+        fields: str = constants.FIELDS_PLAYLIST_LISTING
+    ) -> spotify.validators.playlist.Playlist:
+        """Retrieve a playlist from the Spotify API
+
+        Args:
+            access_token (str): A valid Spotify API access token
+            playlist_id (str): The Spotify ID of the playlist
+            fields (str, optional): fields filter. Defaults to FIELDS_PLAYLIST_LISTING.
+
+        Returns:
+            spotify.validators.playlist.Playlist
+        """
+        # the fields what we want returned you add more later check the spotify.validators.playlist file for the classnames and properties returned
+        # dont forget to update that file if you add or remove any more to the fields
+        url = add_fields_filter(constants.URI_PLAYLIST(playlist_id), fields)
+        return await self.get_model(spotify.validators.playlist.Playlist, access_token, url)
+
+    async def get_playlist_tracks(
+        self, access_token, playlist_id, offset=0, limit=100,
+        fields: str = constants.FIELDS_TRACKS_BACKUP
+    ) -> spotify.validators.tracks.Tracks:
+        """gets the users playlist tracks
+
+        Args:
+            access_token (_type_): the users authentication token
+            playlist_id (_type_):
+            offset (int, optional): Specifies the first track \
+                and is used with the limit to paginate the return tracks. Defaults to 0.
+            limit (int, optional): the amount of tracks to return (Max=100). Defaults to 100.
+            fields (str, optional): fields filter. Defaults to FIELDS_TRACKS_BACKUP.
+
+        Returns:
+            spotify.validators.playlists.Tracks
+        """
+        params = {"offset": offset, "limit": limit}
+        url = add_fields_filter(constants.URI_PLAYLIST_TRACKS(playlist_id), fields)
+        return await self.get_model(spotify.validators.tracks.Tracks, access_token, url, params)
+
+    async def get_playlist_tracks_raw(
+        self, access_token: str, playlist_id: str, offset: int = 0, limit: int = 100,
+        fields: str = None
+    ) -> bytes:
+        """same as get_playlist_tracks but the response body is returned as it was
+        received. Nothing is parsed or validated
+
+        Args:
+            fields (str, optional): fields filter. Defaults to None, everything Spotify returns.
+
+        Raises:
+            SpotifyError: if the response wasnt a 200
+
+        Returns:
+            bytes: the json body of the page
+        """
         params = {"offset": offset, "limit": limit}
+        url = add_fields_filter(constants.URI_PLAYLIST_TRACKS(playlist_id), fields)
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers, params=params) as response:
+        async def fetch() -> bytes:
+            response = await self.authorized_request("GET", url, access_token, params=params)
             if response.status == constants.STATUS_OK:
-                json_response = await response.json()
-                return spotify.validators.playlists.Playlists(**json_response)
+                return response.body
             raise_spotify_exception(response)
 
+        key = (bytes, url, tuple(sorted(params.items())), access_token)
+        return await self._single_flight(key, fetch)
 
-async def get_user_info(token: str) -> spotify.validators.user.User:
-    """gets the Users details from the Spotify API
+    async def get_playlist_tracks_from_url(
+        self, access_token: str, url: str,
+        fields: str = constants.FIELDS_TRACKS_LISTING
+    ) -> spotify.validators.tracks.Tracks:
+        """retrieve tracks from the exact URL. Used in conjuction with get_playlist
+        as Playlist.Tracks contains next and prev links to tracks from the playlist
+        remember that as of the current time of writing this library that Spotify limits
+        tracks request by 100 so if users playlist has more than 100 tracks in it then
+        pagination is required
 
-    Args:
-        token (str): the authenticating token
+        Args:
+            access_token (str):
+            url (str): the tracks url to follow
+            fields (str, optional): fields filter. Defaults to FIELDS_TRACKS_LISTING.
+
+        Returns:
+            Tracks: check the spotify.validators.tracks.Tracks for details
+        """
+        url = add_fields_filter(url, fields)
+        return await self.get_model(spotify.validators.tracks.Tracks, access_token, url)
+
+    async def create_playlist(
+        self, access_token: str, user_id: str, name: str, description: str = "", public: bool = False
+    ) -> spotify.validators.playlist.Playlist:
+        """creates an empty playlist owned by the user
+
+        Args:
+            access_token (str): the users authentication token
+            user_id (str): the Spotify ID of the user
+            name (str): name of the new playlist
+            description (str, optional): Defaults to "".
+            public (bool, optional): Defaults to False.
+
+        Raises:
+            SpotifyError: if the playlist wasnt created
+
+        Returns:
+            spotify.validators.playlist.Playlist: the new playlist
+        """
+        response = await self.authorized_request(
+            "POST", constants.URI_USER_PLAYLISTS(user_id), access_token,
+            json_body={"name": name, "description": description or "", "public": public})
+        if response.status in (constants.STATUS_OK, constants.STATUS_CREATED):
+            return spotify.validators.playlist.Playlist(**response.json())
+        raise_spotify_exception(response)
+
+    async def add_tracks_to_playlist(
+        self, access_token: str, playlist_id: str, uris: List[str], position: int = None
+    ) -> str:
+        """adds tracks to a playlist
+
+        Args:
+            access_token (str): the users authentication token
+            playlist_id (str): the Spotify ID of the playlist
+            uris (List[str]): no more than MAX_TRACKS_PER_WRITE track uris
+            position (int, optional): where to insert the tracks. Defaults to None, the end of the playlist.
+
+        Raises:
+            ValueError: if there are too many uris
+            SpotifyError: if the tracks werent added
+
+        Returns:
+            str: the snapshot_id of the playlist after the tracks were added
+        """
+        if len(uris) > MAX_TRACKS_PER_WRITE:
+            raise ValueError(f"Spotify only takes {MAX_TRACKS_PER_WRITE} tracks per request")
+        body = {"uris": uris}
+        if position is not None:
+            body["position"] = position
+        response = await self.authorized_request(
+            "POST", constants.URI_PLAYLIST_TRACKS(playlist_id), access_token, json_body=body)
+        if response.status in (constants.STATUS_OK, constants.STATUS_CREATED):
+            return response.json()["snapshot_id"]
+        raise_spotify_exception(response)
+
+    async def remove_tracks_from_playlist(
+        self, access_token: str, playlist_id: str, uris: List[str], snapshot_id: str = None
+    ) -> str:
+        """removes every occurrence of the tracks from a playlist
+
+        Args:
+            access_token (str): the users authentication token
+            playlist_id (str): the Spotify ID of the playlist
+            uris (List[str]): no more than MAX_TRACKS_PER_WRITE track uris
+            snapshot_id (str, optional): the version of the playlist the tracks are removed from. Defaults to None.
+
+        Raises:
+            ValueError: if there are too many uris
+            SpotifyError: if the tracks werent removed
+
+        Returns:
+            str: the snapshot_id of the playlist after the tracks were removed
+        """
+        if len(uris) > MAX_TRACKS_PER_WRITE:
+            raise ValueError(f"Spotify only takes {MAX_TRACKS_PER_WRITE} tracks per request")
+        body = {"tracks": [{"uri": uri} for uri in uris]}
+        if snapshot_id is not None:
+            body["snapshot_id"] = snapshot_id
+        response = await self.authorized_request(
+            "DELETE", constants.URI_PLAYLIST_TRACKS(playlist_id), access_token, json_body=body)
+        if response.status == constants.STATUS_OK:
+            return response.json()["snapshot_id"]
+        raise_spotify_exception(response)
+
+    async def reorder_playlist_tracks(
+        self, access_token: str, playlist_id: str, range_start: int, insert_before: int,
+        range_length: int = 1, snapshot_id: str = None
+    ) -> str:
+        """moves a run of tracks to another position in the playlist
+
+        Args:
+            access_token (str): the users authentication token
+            playlist_id (str): the Spotify ID of the playlist
+            range_start (int): position of the first track to move
+            insert_before (int): the tracks are moved before this position. Counted before the move
+            range_length (int, optional): amount of tracks to move. Defaults to 1.
+            snapshot_id (str, optional): the version of the playlist to reorder. Defaults to None.
+
+        Raises:
+            SpotifyError: if the tracks werent moved
+
+        Returns:
+            str: the snapshot_id of the playlist after the move
+        """
+        body = {"range_start": range_start, "insert_before": insert_before, "range_length": range_length}
+        if snapshot_id is not None:
+            body["snapshot_id"] = snapshot_id
+        response = await self.authorized_request(
+            "PUT", constants.URI_PLAYLIST_TRACKS(playlist_id), access_token, json_body=body)
+        if response.status == constants.STATUS_OK:
+            return response.json()["snapshot_id"]
+        raise_spotify_exception(response)
+
+
+# one SpotifyClient per event loop. The RedirectListener thread runs its own loop
+# and an aiohttp session can only be used on the loop it was created on
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SpotifyClient]" = \
+    weakref.WeakKeyDictionary()
+
+
+def get_client() -> SpotifyClient:
+    """gets the shared SpotifyClient for the running event loop. Creates one if
+    the loop doesnt have one yet. Must be called from within a coroutine
 
     Returns:
-        spotify.validators.user.User
+        SpotifyClient: the shared client
     """
-    # Set the authorization header
-    headers = create_auth_token_header(token)
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = SpotifyClient(cache=spotify.cache.get_cache())
+    return client
 
-    async with aiohttp.ClientSession() as session:
-        # Send the GET request
-        async with session.get(constants.URI_USER, headers=headers) as response:
-            # Check the status code
-            if response.status != constants.STATUS_OK:
-                raise_spotify_exception(response)
 
-            # Return the user information as a dictionary
-            json_response = await response.json()
-            user = spotify.validators.user.User(**json_response)
-            return user
+async def close_client():
+    """closes the shared SpotifyClient of the running event loop. Should be called
+    before the loop closes
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+# module level functions are wrappers around the shared SpotifyClient
+
+async def authorize(client_id: str, scopes: tuple) -> str:
+    """check SpotifyClient.authorize
+    """
+    return await get_client().authorize(client_id, scopes)
+
+
+async def exchange_code_for_token(client_id: str, client_secret: str, code: str) -> dict:
+    """check SpotifyClient.exchange_code_for_token
+    """
+    return await get_client().exchange_code_for_token(client_id, client_secret, code)
+
+
+async def refresh_access_token(client_id: str, client_secret: str, refresh_token: str) -> dict:
+    """check SpotifyClient.refresh_access_token
+    """
+    return await get_client().refresh_access_token(client_id, client_secret, refresh_token)
+
+
+async def get_playlists(
+    token: str, url: str = "", offset: int = 0, limit: int = 5,
+    fields: str = constants.FIELDS_PLAYLISTS
+) -> spotify.validators.playlists.Playlists:
+    """check SpotifyClient.get_playlists
+    """
+    return await get_client().get_playlists(token, url, offset, limit, fields)
+
+
+async def get_user_info(token: str) -> spotify.validators.user.User:
+    """check SpotifyClient.get_user_info
+    """
+    return await get_client().get_user_info(token)
 
 
 async def get_playlist(
-    access_token: str, playlist_id: str
+    access_token: str, playlist_id: str,
+    fields: str = constants.FIELDS_PLAYLIST_LISTING
 ) -> spotify.validators.playlist.Playlist:
-    """Retrieve a playlist from the Spotify API
+    """check SpotifyClient.get_playlist
+    """
+    return await get_client().get_playlist(access_token, playlist_id, fields)
 
-    Args:
-        access_token (str): A valid Spotify API access token
-        playlist_id (str): The Spotify ID of the playlist
 
-    Returns:
-        spotify.validators.playlist.Playlist
+async def get_playlist_tracks(
+    access_token, playlist_id, offset=0, limit=100,
+    fields: str = constants.FIELDS_TRACKS_BACKUP
+) -> spotify.validators.tracks.Tracks:
+    """check SpotifyClient.get_playlist_tracks
     """
-    headers = create_auth_token_header(access_token)
-    # the fields what we want returned you add more later check the spotify.validators.playlist file for the classnames and properties returned
-    # dont forget to update that file if you add or remove any more to the fields
-    query_params = {
-        "fields": "id,name,tracks(\
-            items(added_at,track(album,artists,href,uri,name)),\
-                next,previous,offset,total)",
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            constants.URI_PLAYLIST(playlist_id), headers=headers, params=query_params
-        ) as response:
-            if response.status == constants.STATUS_OK:
-                json_response = await response.json()
-                plylist = spotify.validators.playlist.Playlist(
-                    **json_response)
-                return plylist
-            raise_spotify_exception(response)
+    return await get_client().get_playlist_tracks(access_token, playlist_id, offset, limit, fields)
 
 
-async def get_playlist_tracks(
-    access_token, playlist_id, offset=0, limit=100
+async def iter_playlist_track_pages(
+    access_token: str,
+    playlist_id: str,
+    limit: int = MAX_TRACKS_PAGE_LIMIT,
+    concurrency: int = MAX_CONCURRENT_PAGES,
+    fields: str = constants.FIELDS_TRACKS_BACKUP,
+    raw: bool = False,
+    total: int = None
 ) -> spotify.validators.tracks.Tracks:
-    """gets the users playlist tracks
+    """yields every page of tracks from the playlist in playlist order. The first page
+    is requested on its own to read the total, then every remaining offset is known
+    and those pages are requested concurrently. No more than concurrency pages
+    are in flight or held in memory at once. If the total is already known every page
+    is requested concurrently from the start
 
     Args:
-        access_token (_type_): the users authentication token
-        playlist_id (_type_):
-        offset (int, optional): Specifies the first track \
-            and is used with the limit to paginate the return tracks. Defaults to 0.
-        limit (int, optional): the amount of tracks to return (Max=100). Defaults to 100.
+        access_token (str): the users authentication token
+        playlist_id (str): the Spotify ID of the playlist
+        limit (int, optional): tracks per page. Defaults to MAX_TRACKS_PAGE_LIMIT.
+        concurrency (int, optional): maximum pages requested at the same time. Defaults to MAX_CONCURRENT_PAGES.
+        fields (str, optional): fields filter. Defaults to FIELDS_TRACKS_BACKUP.
+        raw (bool, optional): yield the response bodies without validating them. Defaults to False.
+        total (int, optional): the amount of tracks in the playlist. The fields filter can leave
+        out the paging fields if this is given. Defaults to None.
 
-    Returns:
-        spotify.validators.playlists.Tracks
+    Yields:
+        spotify.validators.tracks.Tracks: the next page in order. bytes if raw is True
     """
-    params = {"offset": offset, "limit": limit}
-    headers = create_auth_token_header(access_token)
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            constants.URI_PLAYLIST_TRACKS(playlist_id), 
-            headers=headers, params=params) as response:
-            if response.status == constants.STATUS_OK:
-                tracks = await response.json()
-                return spotify.validators.tracks.Tracks(**tracks)
-            raise_spotify_exception(response)
+    client = get_client()
+    get_page = client.get_playlist_tracks_raw if raw else client.get_playlist_tracks
+    if total is None:
+        first_page = await get_page(access_token, playlist_id, 0, limit, fields)
+        # only the total is needed from the first raw page
+        total = json.loads(first_page)["total"] if raw else first_page.total
+        offsets = iter(range(limit, total, limit))
+    else:
+        first_page = None
+        offsets = iter(range(0, total, limit))
+
+    def request_page(offset: int) -> asyncio.Task:
+        return asyncio.ensure_future(
+            get_page(access_token, playlist_id, offset, limit, fields))
+
+    pending = collections.deque(
+        map(request_page, itertools.islice(offsets, max(concurrency, 1))))
+    try:
+        if first_page is not None:
+            yield first_page
+        while pending:
+            page = await pending.popleft()
+            # keep the window full before handing the page back to the caller
+            offset = next(offsets, None)
+            if offset is not None:
+                pending.append(request_page(offset))
+            yield page
+    finally:
+        # the caller stopped iterating or an error was raised
+        for task in pending:
+            task.cancel()
 
 
 async def get_all_track_items(
-    access_token: str, playlist_id: str
+    access_token: str,
+    playlist_id: str,
+    limit: int = MAX_TRACKS_PAGE_LIMIT,
+    concurrency: int = MAX_CONCURRENT_PAGES,
+    fields: str = constants.FIELDS_TRACKS_BACKUP
 ) -> spotify.validators.tracks.Item:
-    url = constants.URI_PLAYLIST_TRACKS(playlist_id)
-    # get the first track list
-    while url:
-        tracks: spotify.validators.tracks = await get_playlist_tracks_from_url(
-            access_token, url
-        )
-        if tracks.items:
-            # loop through each track
-            for item in tracks.items:
-                yield item
-        # more than 100. iterate again
-        url = tracks.next
+    """yields every track item in the playlist in order. check iter_playlist_track_pages
+    """
+    async for tracks in iter_playlist_track_pages(
+            access_token, playlist_id, limit, concurrency, fields):
+        for item in tracks.items:
+            yield item
 
 
 async def get_playlist_tracks_from_url(
-    access_token: str, url: str
+    access_token: str, url: str,
+    fields: str = constants.FIELDS_TRACKS_LISTING
 ) -> spotify.validators.tracks.Tracks:
-    """retrieve tracks from the exact URL. Used in conjuction with get_playlist
-    as Playlist.Tracks contains next and prev links to tracks from the playlist
-    remember that as of the current time of writing this library that Spotify limits
-    tracks request by 100 so if users playlist has more than 100 tracks in it then
-    pagination is required
+    """check SpotifyClient.get_playlist_tracks_from_url
+    """
+    return await get_client().get_playlist_tracks_from_url(access_token, url, fields)
 
-    Args:
-        access_token (str):
-        url (str): the tracks url to follow
 
-    Returns:
-        Tracks: check the spotify.validators.tracks.Tracks for details
+async def create_playlist(
+    access_token: str, user_id: str, name: str, description: str = "", public: bool = False
+) -> spotify.validators.playlist.Playlist:
+    """check SpotifyClient.create_playlist
     """
-    headers = create_auth_token_header(access_token)
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as response:
-            if response.status == constants.STATUS_OK:
-                tracks = await response.json()
-                return spotify.validators.tracks.Tracks(**tracks)
-            raise_spotify_exception(response)
+    return await get_client().create_playlist(access_token, user_id, name, description, public)
+
+
+async def add_tracks_to_playlist(
+    access_token: str, playlist_id: str, uris: List[str], position: int = None
+) -> str:
+    """check SpotifyClient.add_tracks_to_playlist
+    """
+    return await get_client().add_tracks_to_playlist(access_token, playlist_id, uris, position)
+
+
+async def remove_tracks_from_playlist(
+    access_token: str, playlist_id: str, uris: List[str], snapshot_id: str = None
+) -> str:
+    """check SpotifyClient.remove_tracks_from_playlist
+    """
+    return await get_client().remove_tracks_from_playlist(access_token, playlist_id, uris, snapshot_id)
+
+
+async def reorder_playlist_tracks(
+    access_token: str, playlist_id: str, range_start: int, insert_before: int,
+    range_length: int = 1, snapshot_id: str = None
+) -> str:
+    """check SpotifyClient.reorder_playlist_tracks
+    """
+    return await get_client().reorder_playlist_tracks(
+        access_token, playlist_id, range_start, insert_before, range_length, snapshot_id)
@@ -1,3 +1,5 @@
+# requested with the FIELDS_PLAYLIST_LISTING profile in spotify.constants
+
 from __future__ import annotations
 
 from typing import Any, List, Optional
@@ -27,7 +29,6 @@ class Image(BaseModel):
 class Album(BaseModel):
     album_type: str = ""
     artists: List[Artist] = []
-    available_markets: List[str] = []
     _external_urls: ExternalUrls = None
     href: str = ""
     id: str = ""
@@ -71,6 +72,7 @@ class Tracks(BaseModel):
 
 class Playlist(BaseModel):
     name: str = ""
+    snapshot_id: str = ""
     tracks: Tracks = []
     id: str
 
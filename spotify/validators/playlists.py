@@ -1,4 +1,5 @@
 # This is the minimal Playlist information used with get_playlists
+# requested with the FIELDS_PLAYLISTS profile in spotify.constants. images are not requested
 
 from __future__ import annotations
 
@@ -40,7 +41,7 @@ class Item(BaseModel):
     external_urls: ExternalUrls
     href: str
     id: str
-    images: List[Image]
+    images: List[Image] = []
     name: str
     owner: Optional[Owner]
     primary_color: Any
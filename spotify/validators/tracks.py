@@ -1,5 +1,12 @@
 # The Tracks basemodel represents the https://api.spotify.com/v1/{playlistid}/tracks
 
+# The request is filtered by one of the FIELDS_TRACKS profiles in spotify.constants
+# FIELDS_TRACKS_BACKUP fills in every field below
+# FIELDS_TRACKS_LISTING only fills in added_at and the track name, uri, album name and artist names
+# FIELDS_TRACKS_RESTORE only fills in is_local and the track uri
+# so anything outside of the listing profile must have a default value
+# available_markets is never requested
+
 from __future__ import annotations
 
 from typing import Any, List, Optional
@@ -8,22 +15,22 @@ from pydantic import BaseModel
 
 
 class ExternalUrls(BaseModel):
-    spotify: str
+    spotify: str = ""
 
 
 class AddedBy(BaseModel):
-    external_urls: ExternalUrls
-    href: str
-    id: str
-    type: str
-    uri: str
+    external_urls: Optional[ExternalUrls]
+    href: Optional[str]
+    id: Optional[str]
+    type: Optional[str]
+    uri: Optional[str]
 
 
 class Artist(BaseModel):
     external_urls: Optional[ExternalUrls]
     href: Optional[str]
     id: Optional[str]
-    name: Optional[str]
+    name: str = ""
     type: Optional[str]
     uri: Optional[str]
 
@@ -36,13 +43,12 @@ class Image(BaseModel):
 
 class Album(BaseModel):
     album_type: Optional[str]
-    artists: List[Artist]
-    available_markets: Optional[List[str]]
+    artists: List[Artist] = []
     external_urls: Optional[ExternalUrls]
     href: Optional[str]
     id: Optional[str]
     images: Optional[List[Image]]
-    name: Optional[str]
+    name: str = ""
     release_date: Optional[str]
     release_date_precision: Optional[str]
     total_tracks: Optional[int]
@@ -56,24 +62,23 @@ class ExternalIds(BaseModel):
 
 class Track(BaseModel):
     album: Optional[Album]
-    artists: Optional[List[Artist]]
-    available_markets: List[str]
-    disc_number: int
-    duration_ms: int
-    episode: bool
-    explicit: bool
-    external_ids: ExternalIds
-    external_urls: ExternalUrls
-    href: str
-    id: str
-    is_local: bool
-    name: str
-    popularity: int
+    artists: List[Artist] = []
+    disc_number: Optional[int]
+    duration_ms: Optional[int]
+    episode: Optional[bool]
+    explicit: Optional[bool]
+    external_ids: Optional[ExternalIds]
+    external_urls: Optional[ExternalUrls]
+    href: Optional[str]
+    id: Optional[str]
+    is_local: bool = False
+    name: str = ""
+    popularity: Optional[int]
     preview_url: Optional[str]
-    track: bool
-    track_number: int
-    type: str
-    uri: str
+    track: Optional[bool]
+    track_number: Optional[int]
+    type: Optional[str]
+    uri: str = ""
 
 
 class VideoThumbnail(BaseModel):
@@ -81,27 +86,27 @@ class VideoThumbnail(BaseModel):
 
 
 class Item(BaseModel):
-    added_at: str
-    added_by: AddedBy
-    is_local: bool
+    added_at: str = ""
+    added_by: Optional[AddedBy]
+    is_local: bool = False
     primary_color: Any
     track: Optional[Track]
     video_thumbnail: Optional[VideoThumbnail]
 
     @property
     def track_name(self):
-        return self.track.name
-    
+        return self.track.name if self.track is not None else ""
+
     @property
     def track_album(self):
-        return self.track.album
+        return self.track.album if self.track is not None and self.track.album is not None else Album()
 
 
 class Tracks(BaseModel):
-    href: str
-    items: List[Item]
-    limit: int
+    href: str = ""
+    items: List[Item] = []
+    limit: int = 0
     next: Any
-    offset: int
+    offset: int = 0
     previous: Any
-    total: int
+    total: int = 0
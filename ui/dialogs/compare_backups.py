@@ -0,0 +1,55 @@
+import wx
+
+from typing import List, Optional
+
+from playlist_manager import StoredBackup
+
+
+class CompareBackupsDialog(wx.Dialog):
+    def __init__(self, parent: any, backups: List[StoredBackup]):
+        super().__init__(parent, title="Compare Backups", style=wx.CAPTION | wx.CLOSE_BOX)
+
+        self.backups = backups
+        choices = [f"{backup.name} - {backup.date_added}" for backup in backups]
+
+        old_label = wx.StaticText(self, label="From:")
+        self.old_choice = wx.Choice(self, choices=choices)
+        new_label = wx.StaticText(self, label="To:")
+        self.new_choice = wx.Choice(self, choices=choices)
+        # backups are newest first so default to the last two
+        self.old_choice.SetSelection(min(1, len(choices) - 1))
+        self.new_choice.SetSelection(0)
+
+        gs = wx.FlexGridSizer(2, 2, 5, 5)
+        gs.AddGrowableCol(1, 1)
+        gs.Add(old_label, 0, wx.ALIGN_CENTER_VERTICAL, 0)
+        gs.Add(self.old_choice, 1, wx.EXPAND, 0)
+        gs.Add(new_label, 0, wx.ALIGN_CENTER_VERTICAL, 0)
+        gs.Add(self.new_choice, 1, wx.EXPAND, 0)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(gs, 1, wx.EXPAND | wx.ALL, 10)
+        sizer.Add(self.CreateButtonSizer(wx.OK | wx.CANCEL), 0, wx.ALL | wx.ALIGN_CENTER_HORIZONTAL, 10)
+        self.SetSizerAndFit(sizer)
+        self.SetSize((400, -1))
+        self.CenterOnParent()
+
+    def get_selection(self) -> tuple:
+        """
+        Returns:
+            tuple: (old backup id, new backup id)
+        """
+        return (self.backups[self.old_choice.GetSelection()].id,
+                self.backups[self.new_choice.GetSelection()].id)
+
+
+def create_dialog(parent: any, backups: List[StoredBackup]) -> Optional[tuple]:
+    """asks which two backups to compare
+
+    Returns:
+        Optional[tuple]: (old backup id, new backup id) or None if cancelled
+    """
+    dlg = CompareBackupsDialog(parent, backups)
+    selection = dlg.get_selection() if dlg.ShowModal() == wx.ID_OK else None
+    dlg.Destroy()
+    return selection
@@ -13,6 +13,7 @@ from globals.state import UserState
 import globals.logger
 
 from spotify.validators.playlist import Playlist
+import spotify.constants
 import spotify.net
 
 import image_manager
@@ -76,6 +77,17 @@ class MainFrame(wx.Frame):
         self.debug_menu.Append(self.all_tracks)
         self.debug_menu.Append(show_loading_dlg)
 
+        # Backups menu
+        self.backups_menu = wx.Menu()
+        self.compare_backups_menuitem = wx.MenuItem(
+            self.backups_menu, wx.ID_ANY, "Compare Backups...")
+        self.Bind(wx.EVT_MENU, self.on_compare_backups, self.compare_backups_menuitem)
+        self.backups_menu.Append(self.compare_backups_menuitem)
+        # read by the backup button. check PlaylistManager.backup_playlists
+        self.raw_backups_menuitem = wx.MenuItem(
+            self.backups_menu, wx.ID_ANY, "Lossless Raw Backups", kind=wx.ITEM_CHECK)
+        self.backups_menu.Append(self.raw_backups_menuitem)
+
         # Help menu
         self.help_menu = wx.Menu()
         self.about_menuitem = wx.MenuItem(self.help_menu, wx.ID_ANY, "About")
@@ -85,6 +97,7 @@ class MainFrame(wx.Frame):
         # Append the menus to the menubar
         self.menu_bar.Append(self.user_menu, "User")
         self.menu_bar.Append(self.view_menu, "View")
+        self.menu_bar.Append(self.backups_menu, "Backups")
         self.menu_bar.Append(self.debug_menu, "Debug")
         self.menu_bar.Append(self.help_menu, "Help")
 
@@ -119,10 +132,10 @@ class MainFrame(wx.Frame):
                             [current_task])
         dlg.Show(True)
         async for item in spotify.net.get_all_track_items(
-            UserState.get_token(), playlist.id):
+            UserState.get_token(), playlist.id, fields=spotify.constants.FIELDS_TRACKS_LISTING):
             try:
                 dlg.update_progress()
-                dlg.append_text(text=f"Loaded {item.track.name}.")
+                dlg.append_text(text=f"Loaded {item.track_name}.")
             except (AttributeError, TypeError) as err:
                 globals.logger.console(
                     f"Error updating the progress of all tracks. {err.__str__()}", "error")
@@ -140,6 +153,9 @@ class MainFrame(wx.Frame):
             pass
         dlg.Destroy()    
     
+    def on_compare_backups(self, evt: wx.CommandEvent):
+        asyncio.get_event_loop().create_task(wx.GetApp().retrieve_backups_to_compare())
+
     def on_about_menu(self, evt: wx.CommandEvent):
         dlg = BubbleDialog(self, -1, "SPBackup", [
             "Spotify Backup", "Coded by Paul Millar", "Beta tested by Conor Moore",
@@ -198,12 +214,25 @@ class MainPanel(wx.Panel):
     def __init__(self, parent):
         super().__init__(parent)
 
+        UI.search_ctrl = wx.SearchCtrl(self, style=wx.TE_PROCESS_ENTER)
+        UI.search_ctrl.SetDescriptiveText("Search all backups")
+        UI.search_ctrl.ShowCancelButton(True)
+        UI.search_ctrl.Bind(wx.EVT_TEXT, self.on_search_text)
+        UI.search_ctrl.Bind(wx.EVT_SEARCHCTRL_CANCEL_BTN, self.on_search_cancel)
         UI.playlists_toolbar = PlaylistsToolBar(self)
         UI.playlists_spw = PlaylistSplitterWindow(self)
         UI.playlistinfo_toolbar = PlaylistToolbar(self)
 
         vbox = wx.BoxSizer(wx.VERTICAL)
+        vbox.Add(UI.search_ctrl, 0, wx.EXPAND | wx.ALL, 2)
         vbox.Add(UI.playlists_toolbar, 0, wx.EXPAND, 0)
         vbox.Add(UI.playlists_spw, 1, wx.EXPAND, 0)
         vbox.Add(UI.playlistinfo_toolbar, 0, wx.EXPAND|wx.ALL, 0)
         self.SetSizer(vbox)
+
+    def on_search_text(self, evt: wx.CommandEvent):
+        wx.GetApp().search_backups(evt.GetString())
+
+    def on_search_cancel(self, evt: wx.CommandEvent):
+        UI.search_ctrl.ChangeValue("")
+        wx.GetApp().search_backups("")
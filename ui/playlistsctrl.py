@@ -1,5 +1,6 @@
 import wx
 import asyncio
+from datetime import datetime
 
 import wx.lib.mixins.listctrl as listmix
 
@@ -47,22 +48,23 @@ class PlaylistsNavButtonsPanel(NavButtonPanel):
         token = UserState.get_token()
         if not token:
             return
-        # task: asyncio.Task = app.playlist_manager.running_task
-        # if not task or task.done() or task.cancelled():
-        #     # ok to run the backup task
-        #     app.playlist_manager.running_task = asyncio.create_task(
-        #         app.playlist_manager.backup_playlists(
-        #             app.playlists_backup_handler,
-        #             token,
-        #             "test",
-        #             "this is to test the database entry"
-        #         )
-        #     )
-        import playlist_manager
-        asyncio.create_task(playlist_manager.backup_the_playlists(token))
+        task: asyncio.Task = app.playlist_manager.running_task
+        if not task or task.done() or task.cancelled():
+            # ok to run the backup task
+            app.playlist_manager.running_task = asyncio.create_task(
+                app.playlist_manager.backup_playlists(
+                    app.playlists_backup_handler,
+                    token,
+                    f"Backup {datetime.now():%Y-%m-%d %H:%M}",
+                    "",
+                    raw=UI.main_frame.raw_backups_menuitem.IsChecked()
+                )
+            )
 
     def on_restore_click(self, evt: wx.CommandEvent):
-        print("Restore clicked")
+        if not UserState.get_token():
+            return
+        asyncio.get_event_loop().create_task(wx.GetApp().retrieve_backups_to_restore())
 
 
 class PlaylistsToolBar(wx.Panel):
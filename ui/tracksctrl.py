@@ -3,6 +3,14 @@ import asyncio
 import wx.lib.mixins.listctrl as listmix
 import spotify.validators.playlist
 from ui.navbuttonpanel import NavButtonPanel
+from typing import List
+from playlist_manager import (
+    DiffType,
+    PlaylistDiff,
+    SearchPlaylist,
+    SearchResult,
+    StoredTrack
+)
 
 from globals.state import (
     SpotifyState,
@@ -46,7 +54,12 @@ class TracksNavButtonPanel(NavButtonPanel):
         print("Backup clicked")
     
     def on_restore_click(self, evt: wx.CommandEvent):
-        print("Restore clicked")
+        # restores the loaded playlist from a backup
+        playlist = SpotifyState.get_playlist()
+        if not playlist:
+            return
+        asyncio.get_event_loop().create_task(
+            wx.GetApp().retrieve_backups_to_restore([playlist.id]))
         
         
 class PlaylistToolbar(wx.Panel):
@@ -128,4 +141,59 @@ class TracksCtrl(wx.ListCtrl, listmix.ListCtrlAutoWidthMixin):
         artist_string = " / ".join(map(get_artist_name, item.track_album.artists))
         self.SetItem(row_index, 3, artist_string)
         self.SetItem(row_index, 4, item.track_album.name)
-        self.SetItem(row_index, 5, item.added_at)
\ No newline at end of file
+        self.SetItem(row_index, 5, item.added_at)
+
+    def populate_search(self, results: List[SearchResult]):
+        """shows the search results best match first. The last column lists the playlists
+        the track has been in with the first and newest backup it was in
+
+        Args:
+            results (List[SearchResult]): from PlaylistManager.search_tracks
+        """
+        self.clear_items()
+        for rank, result in enumerate(results, start=1):
+            row_index = self.add_stored_track(str(rank), result.track)
+            self.SetItem(row_index, 5, ", ".join(map(format_search_playlist, result.playlists.values())))
+
+    def add_backup_diff(self, diff: PlaylistDiff):
+        """appends the changes of one playlist when comparing two backups.
+        A row for the playlist followed by a row for every added (+), removed (-) and moved (~) track
+
+        Args:
+            diff (PlaylistDiff): from PlaylistManager.iter_backup_diff
+        """
+        if diff.type == DiffType.PLAYLIST_ADDED:
+            status = f"Added with {diff.playlist.total_songs} tracks"
+        elif diff.type == DiffType.PLAYLIST_DELETED:
+            status = "Deleted"
+        else:
+            status = f"{len(diff.added)} added, {len(diff.removed)} removed, {len(diff.moved)} moved"
+        row_index = self.InsertItem(index=self.GetItemCount(), label="")
+        self.SetItem(row_index, 2, diff.playlist.name)
+        self.SetItem(row_index, 3, status)
+        for marker, tracks in (("+", diff.added), ("-", diff.removed), ("~", diff.moved)):
+            for track in tracks:
+                self.add_stored_track(marker, track)
+
+    def add_stored_track(self, marker: str, track: StoredTrack) -> int:
+        row_index = self.InsertItem(index=self.GetItemCount(), label="")
+        self.SetItem(row_index, 1, marker)
+        self.SetItem(row_index, 2, track.name)
+        self.SetItem(row_index, 3, " / ".join(track.artists))
+        self.SetItem(row_index, 4, track.album)
+        return row_index
+
+
+def format_search_playlist(playlist: SearchPlaylist) -> str:
+    """
+    Returns:
+        str: the playlist name followed by the backups, e.g. Chill (Monday 2024-01-01 to Friday 2024-01-05)
+    """
+    first, last = playlist.first_backup, playlist.last_backup
+    if first is None:
+        return playlist.name
+    # date_added is stored with the time, the day is enough here
+    backups = f"{first.name} {first.date_added[:10]}"
+    if last is not None and last.id != first.id:
+        backups += f" to {last.name} {last.date_added[:10]}"
+    return f"{playlist.name} ({backups})"